@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app.accounts.models import Accounts
+from app.database import session_scope
+
+
+class AccountsDAO:
+    @classmethod
+    async def find_all(cls, session=None):
+        async with session_scope(session) as session:
+            result = await session.execute(select(Accounts).order_by(Accounts.email))
+            return result.scalars().all()
+
+    @classmethod
+    async def save(cls, email, credentials, session=None):
+        """Добавляет аккаунт или обновляет его учетные данные (повторная авторизация, обновление токена)."""
+        async with session_scope(session) as session:
+            result = await session.execute(select(Accounts).where(Accounts.email == email))
+            account = result.scalar_one_or_none()
+            if account is None:
+                session.add(Accounts(email=email, credentials=credentials, updated_at=datetime.utcnow()))
+            else:
+                account.credentials = credentials
+                account.updated_at = datetime.utcnow()
+            await session.commit()
+
+    @classmethod
+    async def update_locked(cls, email, update, session=None):
+        """Перечитывает учетные данные под SELECT ... FOR UPDATE и сохраняет результат update.
+
+        Пока транзакция открыта, другие воркеры ждут и получают уже новые данные.
+        """
+        async with session_scope(session) as session:
+            result = await session.execute(select(Accounts).where(Accounts.email == email).with_for_update())
+            account = result.scalar_one()
+            credentials = await update(account.credentials)
+            if credentials != account.credentials:
+                account.credentials = credentials
+                account.updated_at = datetime.utcnow()
+            await session.commit()
+            return credentials
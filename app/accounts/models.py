@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from sqlalchemy.orm import mapped_column, Mapped
+from app.database import Base
+
+
+class Accounts(Base):
+    __tablename__ = "accounts"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    email: Mapped[str] = mapped_column(unique=True)
+    # Учетные данные OAuth, зашифрованные Fernet (тот же формат, что в CREDENTIALS_FILE)
+    credentials: Mapped[str]
+    updated_at: Mapped[datetime]
+
+    def __str__(self):
+        return f"Account {self.email}"
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge, Histogram
+
+ADMISSION_IN_FLIGHT = Gauge(
+    'admission_in_flight_requests', 'Requests admitted and running on a limited route', ['route'],
+    multiprocess_mode='livesum',
+)
+ADMISSION_QUEUED = Gauge(
+    'admission_queued_requests', 'Requests waiting for a slot on a limited route', ['route'],
+    multiprocess_mode='livesum',
+)
+ADMISSION_WAIT = Histogram(
+    'admission_wait_seconds', 'Time a request waited in the admission queue', ['route'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+ADMISSION_REJECTED = Counter(
+    'admission_rejected_total', 'Requests shed by admission control', ['route', 'reason']
+)
+
+
+class AdmissionLimit:
+    """Зависимость FastAPI: не больше limit одновременных запросов маршрута.
+
+    Сверх лимита запрос ждет в очереди не дольше timeout секунд; если очередь
+    (queue_size) заполнена или время вышло, сразу отвечаем 503 с Retry-After,
+    а не копим запросы, пока не кончится память. Значения по умолчанию
+    переопределяются через ADMISSION_<NAME>_LIMIT, _QUEUE, _TIMEOUT, _RETRY_AFTER.
+    Если дорогая только часть маршрута, вместо зависимости - async with limit.slot().
+    """
+
+    def __init__(self, name, limit, queue_size, timeout=30, retry_after=5):
+        prefix = f"ADMISSION_{name.upper().replace('-', '_')}_"
+        self.name = name
+        self.limit = int(os.getenv(prefix + "LIMIT", limit))
+        self.queue_size = int(os.getenv(prefix + "QUEUE", queue_size))
+        self.timeout = float(os.getenv(prefix + "TIMEOUT", timeout))
+        self.retry_after = int(os.getenv(prefix + "RETRY_AFTER", retry_after))
+        self._semaphore = asyncio.Semaphore(self.limit)
+        self._waiting = 0
+
+    async def __call__(self):
+        async with self.slot():
+            yield
+
+    @asynccontextmanager
+    async def slot(self):
+        await self._acquire()
+        ADMISSION_IN_FLIGHT.labels(route=self.name).inc()
+        try:
+            yield
+        finally:
+            ADMISSION_IN_FLIGHT.labels(route=self.name).dec()
+            self._semaphore.release()
+
+    async def _acquire(self):
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            ADMISSION_WAIT.labels(route=self.name).observe(0)
+            return
+        if self._waiting >= self.queue_size:
+            self._reject("queue_full")
+
+        self._waiting += 1
+        ADMISSION_QUEUED.labels(route=self.name).inc()
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._reject("timeout")
+        finally:
+            self._waiting -= 1
+            ADMISSION_QUEUED.labels(route=self.name).dec()
+            ADMISSION_WAIT.labels(route=self.name).observe(time.perf_counter() - start_time)
+
+    def _reject(self, reason):
+        ADMISSION_REJECTED.labels(route=self.name, reason=reason).inc()
+        logging.warning(f"Shedding {self.name} request: {reason}, {self.limit} running, {self._waiting} queued")
+        raise HTTPException(
+            status_code=503,
+            detail=f"{self.name} is overloaded, retry later",
+            headers={"Retry-After": str(self.retry_after)},
+        )
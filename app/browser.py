@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import pickle
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from prometheus_client import Counter, Histogram
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+# Облегченный профиль: картинки, медиа и шрифты не грузим, лишние фичи отключаем,
+# память рендерера ограничиваем
+BROWSER_JS_HEAP_MB = int(os.getenv("BROWSER_JS_HEAP_MB", 512))
+BROWSER_RENDERER_LIMIT = int(os.getenv("BROWSER_RENDERER_LIMIT", 2))
+
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg", "*.wav", "*.m4a",
+    "*fonts.gstatic.com*", "*fonts.googleapis.com*",
+]
+
+LEAN_ARGUMENTS = [
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-notifications",
+    "--no-first-run",
+    "--mute-audio",
+    "--blink-settings=imagesEnabled=false",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication",
+    f"--renderer-process-limit={BROWSER_RENDERER_LIMIT}",
+    f"--js-flags=--max-old-space-size={BROWSER_JS_HEAP_MB}",
+]
+
+LEAN_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.managed_default_content_settings.media_stream": 2,
+    "profile.managed_default_content_settings.notifications": 2,
+    "profile.managed_default_content_settings.geolocation": 2,
+}
+
+SELENIUM_STEP_DURATION = Histogram(
+    'selenium_step_duration_seconds', 'Duration of a browser automation step', ['flow', 'step'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+SELENIUM_STEPS = Counter(
+    'selenium_steps_total', 'Browser automation steps by outcome', ['flow', 'step', 'outcome']
+)
+BROWSER_STARTUP = Histogram(
+    'selenium_browser_startup_seconds', 'Time to start Chrome and chromedriver', ['flow'],
+    buckets=(0.5, 1, 2, 3, 5, 10, 20, 30, 60),
+)
+BROWSER_PEAK_RSS = Histogram(
+    'selenium_browser_peak_rss_bytes', 'Peak RSS of the browser process tree per session', ['flow'],
+    buckets=tuple(mb * 2**20 for mb in (64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096)),
+)
+
+PAGE_LOAD_SCRIPT = """
+const entry = performance.getEntriesByType('navigation')[0];
+return entry ? entry.loadEventEnd - entry.startTime : null;
+"""
+
+
+@lru_cache
+def chromedriver_path():
+    # ChromeDriverManager().install() ходит в сеть, достаточно одного раза на процесс
+    return ChromeDriverManager().install()
+
+
+def create_driver(flow, headless=True, extra_args=()):
+    """flow - имя сценария для метрик (accept_invitation, parse_groups...)."""
+    start_time = time.perf_counter()
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless")
+    for argument in [*LEAN_ARGUMENTS, *extra_args]:
+        options.add_argument(argument)
+    options.add_experimental_option("prefs", LEAN_PREFS)
+
+    driver = webdriver.Chrome(service=Service(chromedriver_path()), options=options)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    BROWSER_STARTUP.labels(flow=flow).observe(time.perf_counter() - start_time)
+
+    driver.flow = flow
+    driver.peak_rss = 0
+    logging.info(f"Chrome driver initialized, browser RSS {sample_rss(driver) / 2**20:.1f} MiB.")
+    return driver
+
+
+@contextmanager
+def step(driver, name):
+    """Замеряет шаг сценария: длительность, успех/ошибку и RSS браузера после шага."""
+    start_time = time.perf_counter()
+    outcome = "failure"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        SELENIUM_STEP_DURATION.labels(flow=driver.flow, step=name).observe(time.perf_counter() - start_time)
+        SELENIUM_STEPS.labels(flow=driver.flow, step=name, outcome=outcome).inc()
+        sample_rss(driver)
+
+
+def open_page(driver, url, step_name="open_page"):
+    with step(driver, step_name):
+        start_time = time.perf_counter()
+        driver.get(url)
+        elapsed = time.perf_counter() - start_time
+        load_ms = driver.execute_script(PAGE_LOAD_SCRIPT)
+    load_info = f", navigation load {load_ms:.0f} ms" if load_ms else ""
+    logging.info(f"Opened {url} in {elapsed:.2f}s{load_info}, browser RSS {driver.peak_rss / 2**20:.1f} MiB peak.")
+    return elapsed
+
+
+def add_cookies(driver, cookies_path):
+    with open(cookies_path, 'rb') as f:
+        for cookie in pickle.load(f):
+            # Удаляем 'expiry' если она есть, т.к. она мешает установке куки
+            cookie.pop('expiry', None)
+            driver.add_cookie(cookie)
+    logging.info("Cookies loaded into the browser.")
+
+
+def quit_driver(driver):
+    sample_rss(driver)
+    BROWSER_PEAK_RSS.labels(flow=driver.flow).observe(driver.peak_rss)
+    logging.info(f"Browser peak RSS {driver.peak_rss / 2**20:.1f} MiB.")
+    driver.quit()
+    logging.info("Chrome driver quit.")
+
+
+def sample_rss(driver):
+    rss = browser_rss_bytes(driver)
+    driver.peak_rss = max(driver.peak_rss, rss)
+    return rss
+
+
+def browser_rss_bytes(driver):
+    """Суммарный RSS chromedriver и всех дочерних процессов Chrome (Linux /proc)."""
+    process = getattr(driver.service, "process", None)
+    if process is None:
+        return 0
+
+    children = {}
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                # ppid - четвертое поле после имени процесса в скобках
+                ppid = int(file.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total = 0
+    pending = [process.pid]
+    while pending:
+        pid = pending.pop()
+        pending.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/statm") as file:
+                total += int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+# Один execute_script вместо .text/.get_attribute на каждый элемент:
+# каждый такой вызов - отдельный HTTP-запрос к WebDriver
+EXTRACT_ELEMENTS_SCRIPT = """
+const xpath = arguments[0];
+const scroll = arguments[1];
+const snapshot = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const items = [];
+for (let i = 0; i < snapshot.snapshotLength; i++) {
+    const node = snapshot.snapshotItem(i);
+    const link = node.closest('a[href]');
+    const row = node.closest('[data-id], [data-rowid], [data-group-id], [data-item-id]');
+    items.push({
+        text: (node.innerText || node.textContent || '').trim(),
+        href: typeof node.href === 'string' ? node.href : (link ? link.href : node.getAttribute('href')),
+        id: row ? ['data-id', 'data-rowid', 'data-group-id', 'data-item-id'].map(name => row.getAttribute(name)).find(Boolean) : null,
+    });
+}
+if (scroll && snapshot.snapshotLength) {
+    snapshot.snapshotItem(snapshot.snapshotLength - 1).scrollIntoView({block: 'end'});
+}
+return JSON.stringify(items);
+"""
+
+
+def extract_elements(driver, xpath, scroll=True, scroll_pause=0.5, idle_rounds=2, max_rounds=100):
+    """Возвращает [{"text", "href", "id"}] для всех элементов по xpath.
+
+    Список групп виртуализирован, поэтому после каждого снимка прокручиваем
+    к последнему элементу и повторяем, пока новые элементы не перестанут
+    появляться idle_rounds раз подряд. Элементы различаются по href или
+    data-атрибуту id строки: у span[@role='link'] ссылки нет, а разные группы
+    могут называться одинаково. Текст - только если нет ни того, ни другого.
+    """
+    collected = {}
+    idle = 0
+    for _ in range(max_rounds):
+        items = json.loads(driver.execute_script(EXTRACT_ELEMENTS_SCRIPT, xpath, scroll))
+        before = len(collected)
+        for item in items:
+            collected.setdefault(item["href"] or item["id"] or item["text"], item)
+
+        if not scroll:
+            break
+        if len(collected) == before:
+            idle += 1
+            if idle >= idle_rounds:
+                break
+        else:
+            idle = 0
+        time.sleep(scroll_pause)
+
+    logging.info(f"Extracted {len(collected)} elements for {xpath}")
+    return list(collected.values())
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from prometheus_client import Counter, Histogram
+
+from app.singleflight import SingleFlight
+
+CACHE_REQUESTS = Counter(
+    'result_cache_requests_total', 'Result cache lookups by outcome: hit, stale or miss', ['cache', 'result']
+)
+CACHE_AGE = Histogram(
+    'result_cache_age_seconds', 'Age of the cached result served to a client', ['cache'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200),
+)
+CACHE_REFRESHES = Counter(
+    'result_cache_refreshes_total', 'Background refreshes of stale entries by outcome', ['cache', 'outcome']
+)
+
+HIT, STALE, MISS = "HIT", "STALE", "MISS"
+
+
+class StaleWhileRevalidateCache:
+    """Кэш результатов со stale-while-revalidate.
+
+    Запись свежая ttl секунд. Еще grace секунд после этого она отдается сразу,
+    а в фоне запускается обновление. Старше ttl + grace запись не отдается,
+    и клиент ждет новую загрузку. Загрузки по одному ключу объединяются через
+    SingleFlight, поэтому одновременные промахи и фоновые обновления не дублируются.
+    """
+
+    def __init__(self, name, ttl, grace, maxsize=128, flights=None):
+        self.name = name
+        self.ttl = ttl
+        self.grace = grace
+        self.maxsize = maxsize
+        self.flights = flights or SingleFlight()
+        self.hits = 0
+        self.requests = 0
+        self._entries = OrderedDict()
+        self._refreshing = {}
+
+    @property
+    def hit_ratio(self):
+        return self.hits / self.requests if self.requests else 0.0
+
+    async def get(self, key, func, *args):
+        """Возвращает (значение, HIT/STALE/MISS, возраст в секундах)."""
+        self.requests += 1
+        entry = self._entries.get(key)
+        age = time.monotonic() - entry[1] if entry else None
+
+        if entry is None or age > self.ttl + self.grace:
+            CACHE_REQUESTS.labels(cache=self.name, result="miss").inc()
+            value = await self._load(key, func, *args)
+            return value, MISS, 0
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        CACHE_AGE.labels(cache=self.name).observe(age)
+        if age <= self.ttl:
+            CACHE_REQUESTS.labels(cache=self.name, result="hit").inc()
+            return entry[0], HIT, age
+
+        CACHE_REQUESTS.labels(cache=self.name, result="stale").inc()
+        self._refresh(key, func, *args)
+        return entry[0], STALE, age
+
+    def invalidate(self):
+        self._entries.clear()
+
+    async def _load(self, key, func, *args):
+        value = await self.flights.do(key, func, *args)
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return value
+
+    def _refresh(self, key, func, *args):
+        if key in self._refreshing:
+            return
+        # Ссылку на задачу держим в _refreshing до завершения, иначе ее может собрать GC
+        task = asyncio.ensure_future(self._load(key, func, *args))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda done: self._refresh_done(key, done))
+
+    def _refresh_done(self, key, task):
+        self._refreshing.pop(key, None)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is None:
+            CACHE_REFRESHES.labels(cache=self.name, outcome="success").inc()
+        else:
+            # Остаемся на устаревших данных до конца grace
+            CACHE_REFRESHES.labels(cache=self.name, outcome="failure").inc()
+            logging.error(f"Background refresh of {self.name} cache failed for {key}: {error}")
+
+    def headers(self, status, age):
+        return {
+            "X-Cache": status,
+            "Age": str(int(age)),
+            "X-Cache-Hit-Ratio": f"{self.hit_ratio:.3f}",
+        }
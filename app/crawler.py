@@ -0,0 +1,185 @@
+import json
+import logging
+from contextlib import suppress
+import os
+import re
+import tempfile
+import time
+from collections import deque
+
+from prometheus_client import Counter, Gauge
+
+# Чекпоинты обхода: фронтир (папки и токены страниц) и уже найденные элементы
+CRAWL_CHECKPOINT_DIR = os.getenv("CRAWL_CHECKPOINT_DIR", "/tmp/crawls")
+CRAWL_CHECKPOINT_INTERVAL = float(os.getenv("CRAWL_CHECKPOINT_INTERVAL", 10))
+# Доля времени обхода, которую может занимать запись чекпоинтов на больших деревьях
+CRAWL_CHECKPOINT_MAX_OVERHEAD = float(os.getenv("CRAWL_CHECKPOINT_MAX_OVERHEAD", 0.1))
+# Чекпоинт старше этого не продолжается: данные в нем уже устарели
+CRAWL_CHECKPOINT_MAX_AGE = float(os.getenv("CRAWL_CHECKPOINT_MAX_AGE", 6 * 3600))
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+CHECKPOINT_VERSION = 1
+
+CRAWL_ITEMS = Gauge('crawl_items', 'Items found so far by running crawls', ['crawl'], multiprocess_mode='livesum')
+CRAWL_PENDING_FOLDERS = Gauge(
+    'crawl_pending_folders', 'Folders and pages left in the frontier of running crawls', ['crawl'],
+    multiprocess_mode='livesum',
+)
+CRAWL_PAGES = Counter('crawl_pages_total', 'Drive list pages fetched by crawls', ['crawl'])
+CRAWL_CHECKPOINTS = Counter('crawl_checkpoints_total', 'Crawl checkpoints written', ['crawl'])
+CRAWL_RESUMES = Counter('crawl_resumes_total', 'Crawls resumed from a checkpoint', ['crawl'])
+CRAWL_RUNS = Counter('crawl_runs_total', 'Finished crawls by outcome', ['crawl', 'outcome'])
+
+
+def checkpoint_path(name):
+    return os.path.join(CRAWL_CHECKPOINT_DIR, re.sub(r"[^A-Za-z0-9@._-]+", "_", name) + ".json")
+
+
+class FolderCrawl:
+    """Обход дерева папок Drive с фронтиром вместо рекурсии.
+
+    Фронтир - очередь (папка, токен следующей страницы); результаты хранятся по
+    родительским папкам и в конце собираются в том же порядке, что давал
+    рекурсивный обход. С checkpoint состояние периодически пишется на диск
+    (атомарно), а при ошибке - сразу, и следующий обход с тем же именем
+    продолжается с места остановки. После успешного обхода чекпоинт удаляется.
+    С drive_id листинг идет в корпусе этого общего диска (corpora=drive).
+    """
+
+    def __init__(self, service, root_id, fields, checkpoint=None, label="files", page_size=1000, drive_id=None):
+        self.service = service
+        self.root_id = root_id
+        self.drive_id = drive_id
+        self.fields = fields
+        self.label = label
+        self.page_size = page_size
+        self.path = checkpoint_path(checkpoint) if checkpoint else None
+        self.frontier = deque([(root_id, None)])
+        self.children = {root_id: []}
+        self.started_at = time.time()
+        self.items_found = 0
+        self._reported_items = 0
+        self._reported_pending = 0
+        self._next_checkpoint = time.monotonic() + CRAWL_CHECKPOINT_INTERVAL
+
+    def run(self):
+        if self.path:
+            self._resume()
+        try:
+            while self.frontier:
+                self._fetch_page(*self.frontier[0])
+                self._report()
+                if self.path and time.monotonic() >= self._next_checkpoint:
+                    self._save()
+        except BaseException:
+            CRAWL_RUNS.labels(crawl=self.label, outcome="failure").inc()
+            if self.path:
+                try:
+                    self._save()
+                except OSError as e:
+                    logging.error(f"Failed to save crawl checkpoint {self.path}: {e}")
+            raise
+        finally:
+            CRAWL_ITEMS.labels(crawl=self.label).dec(self._reported_items)
+            CRAWL_PENDING_FOLDERS.labels(crawl=self.label).dec(self._reported_pending)
+
+        CRAWL_RUNS.labels(crawl=self.label, outcome="success").inc()
+        if self.path:
+            # Чекпоинт мог уже удалить параллельный обход с тем же именем
+            with suppress(FileNotFoundError):
+                os.remove(self.path)
+        return self._assemble()
+
+    def _fetch_page(self, folder_id, page_token):
+        # Без supportsAllDrives и includeItemsFromAllDrives содержимое общих дисков не видно
+        corpus = {"corpora": "drive", "driveId": self.drive_id} if self.drive_id else {}
+        results = self.service.files().list(
+            q=f"'{folder_id}' in parents and trashed = false",
+            pageSize=self.page_size,
+            fields=self.fields,
+            pageToken=page_token,
+            supportsAllDrives=True,
+            includeItemsFromAllDrives=True,
+            **corpus,
+        ).execute()
+        CRAWL_PAGES.labels(crawl=self.label).inc()
+        # Страница снимается с фронтира только после успешного ответа, иначе чекпоинт ее потеряет
+        self.frontier.popleft()
+        items = results.get('files', [])
+        self.children.setdefault(folder_id, []).extend(items)
+        self.items_found += len(items)
+        # Следующая страница той же папки - в начало очереди, вложенные папки - в конец
+        if 'nextPageToken' in results:
+            self.frontier.appendleft((folder_id, results['nextPageToken']))
+        for item in items:
+            if item['mimeType'] == FOLDER_MIME_TYPE and item['id'] not in self.children:
+                self.children[item['id']] = []
+                self.frontier.append((item['id'], None))
+
+    def _assemble(self):
+        """Элементы в порядке рекурсивного обхода: папка, затем ее содержимое."""
+        result = []
+        expanded = {self.root_id}
+        stack = [iter(self.children.get(self.root_id, []))]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                continue
+            result.append(item)
+            # Папка с несколькими родителями раскрывается один раз
+            if item['mimeType'] == FOLDER_MIME_TYPE and item['id'] not in expanded:
+                expanded.add(item['id'])
+                stack.append(iter(self.children.get(item['id'], [])))
+        return result
+
+    def _report(self):
+        items, pending = self.items_found, len(self.frontier)
+        CRAWL_ITEMS.labels(crawl=self.label).inc(items - self._reported_items)
+        CRAWL_PENDING_FOLDERS.labels(crawl=self.label).inc(pending - self._reported_pending)
+        self._reported_items, self._reported_pending = items, pending
+
+    def _resume(self):
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable crawl checkpoint {self.path}: {e}")
+            return
+        if (state.get("version") != CHECKPOINT_VERSION or state.get("root_id") != self.root_id
+                or state.get("fields") != self.fields
+                or time.time() - state.get("started_at", 0) > CRAWL_CHECKPOINT_MAX_AGE):
+            logging.info(f"Discarding outdated crawl checkpoint {self.path}")
+            return
+        self.frontier = deque(tuple(entry) for entry in state["frontier"])
+        self.children = state["children"]
+        self.items_found = sum(len(items) for items in self.children.values())
+        self.started_at = state["started_at"]
+        CRAWL_RESUMES.labels(crawl=self.label).inc()
+        logging.info(f"Resuming crawl {self.path}: {self.items_found} items found, {len(self.frontier)} pages left")
+
+    def _save(self):
+        start_time = time.monotonic()
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "root_id": self.root_id,
+            "fields": self.fields,
+            "started_at": self.started_at,
+            "frontier": list(self.frontier),
+            "children": self.children,
+        }
+        os.makedirs(CRAWL_CHECKPOINT_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CRAWL_CHECKPOINT_DIR, prefix=".crawl-")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(state, file)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        CRAWL_CHECKPOINTS.labels(crawl=self.label).inc()
+        # Чекпоинт большого дерева пишется долго: реже, чтобы не тратить на него больше доли обхода
+        elapsed = time.monotonic() - start_time
+        self._next_checkpoint = time.monotonic() + max(CRAWL_CHECKPOINT_INTERVAL, elapsed / CRAWL_CHECKPOINT_MAX_OVERHEAD)
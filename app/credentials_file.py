@@ -0,0 +1,128 @@
+import errno
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from prometheus_client import Counter
+
+CREDENTIALS_REFRESHES = Counter(
+    'credentials_refreshes_total',
+    'Expired OAuth tokens: refreshed here or reloaded after another process refreshed them',
+    ['store', 'outcome'],
+)
+
+
+def needs_refresh(credentials):
+    # Без срока действия (файлы старого формата) токен обновляется один раз, чтобы его узнать
+    return bool(credentials.refresh_token) and (credentials.expiry is None or credentials.expired)
+
+
+def refresh_credentials(credentials):
+    from google.auth.transport.requests import Request
+
+    credentials.refresh(Request())
+
+
+class CredentialsFile:
+    """Зашифрованные учетные данные в файле, общем для всех воркеров.
+
+    Запись атомарная (временный файл и rename) под exclusive flock на
+    отдельном файле блокировки, чтение - под shared flock. Файл перечитывается,
+    только когда меняются его inode, mtime или размер. Истекший токен обновляет
+    один процесс: остальные ждут блокировку и загружают уже обновленный токен.
+    """
+
+    def __init__(self, path, serialize, deserialize, lock_path=None):
+        self.path = path
+        self.lock_path = lock_path or path + ".lock"
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self._lock = threading.Lock()
+        self._signature = None
+        self._credentials = None
+
+    def load(self):
+        """Учетные данные с действительным токеном или None, если файла нет."""
+        if self._stat() is None:
+            return None
+        with self._lock:
+            if self._stat() != self._signature:
+                with self._file_lock(fcntl.LOCK_SH):
+                    self._read()
+            credentials = self._credentials
+        if credentials is not None and needs_refresh(credentials):
+            credentials = self.refresh()
+        return credentials
+
+    def save(self, credentials):
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._write(credentials)
+
+    def refresh(self):
+        """Обновляет токен, если его еще не обновил другой процесс или поток."""
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            # Пока ждали блокировку, файл мог перезаписать другой воркер
+            if self._stat() != self._signature:
+                self._read()
+            credentials = self._credentials
+            if credentials is None or not needs_refresh(credentials):
+                CREDENTIALS_REFRESHES.labels(store="file", outcome="reloaded").inc()
+                return credentials
+            try:
+                refresh_credentials(credentials)
+            except Exception:
+                CREDENTIALS_REFRESHES.labels(store="file", outcome="failure").inc()
+                raise
+            self._write(credentials)
+            CREDENTIALS_REFRESHES.labels(store="file", outcome="refreshed").inc()
+            logging.info(f"Refreshed OAuth token in {self.path}, expires {credentials.expiry}")
+            return credentials
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @contextmanager
+    def _file_lock(self, operation):
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        signature = self._stat()
+        with open(self.path) as file:
+            data = file.read()
+        self._credentials = self.deserialize(data) if data else None
+        self._signature = signature
+
+    def _write(self, credentials):
+        data = self.serialize(credentials)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".credentials-")
+        try:
+            with os.fdopen(fd, "w") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            os.unlink(tmp_path)
+            if e.errno not in (errno.EBUSY, errno.EXDEV):
+                raise
+            # Файл смонтирован в контейнер отдельно (bind mount), заменить его нельзя:
+            # пишем на месте, читатели ждут shared-блокировку и не видят половину файла
+            with open(self.path, "w") as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+        self._credentials = credentials
+        self._signature = self._stat()
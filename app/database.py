@@ -1,11 +1,64 @@
+import time
+from contextlib import asynccontextmanager
+
+from prometheus_client import Gauge, Histogram
+from sqlalchemy import event
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from app.config import settings
 
 DATABASE_URL = settings.DATABASE_URL
-engine = create_async_engine(DATABASE_URL)
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={
+        # кэш подготовленных выражений на стороне SQLAlchemy-адаптера и самого asyncpg
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    },
+)
 async_sessionmaker = async_sessionmaker(bind=engine, expire_on_commit=False)
 
+DB_POOL_CHECKED_OUT = Gauge('db_pool_checked_out_connections', 'Connections currently checked out of the pool', multiprocess_mode='livesum')
+DB_POOL_IDLE = Gauge('db_pool_idle_connections', 'Idle connections kept in the pool', multiprocess_mode='livesum')
+DB_POOL_OVERFLOW = Gauge('db_pool_overflow_connections', 'Connections opened above pool_size', multiprocess_mode='livesum')
+DB_POOL_WAIT = Histogram('db_pool_wait_seconds', 'Time spent waiting for a pooled connection')
+
+def update_pool_gauges():
+    pool = engine.sync_engine.pool
+    DB_POOL_CHECKED_OUT.set(pool.checkedout())
+    DB_POOL_IDLE.set(pool.checkedin())
+    DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+@event.listens_for(engine.sync_engine.pool, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    update_pool_gauges()
+
+@event.listens_for(engine.sync_engine.pool, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    update_pool_gauges()
+
+@asynccontextmanager
+async def session_scope(session=None):
+    """Переданная сессия (например, сессия запроса) или новая, с замером ожидания соединения."""
+    if session is not None:
+        yield session
+        return
+    async with async_sessionmaker() as session:
+        start_time = time.perf_counter()
+        await session.connection()
+        DB_POOL_WAIT.observe(time.perf_counter() - start_time)
+        yield session
+
+async def get_session():
+    """FastAPI-зависимость: одна сессия (и одно соединение из пула) на запрос."""
+    async with session_scope() as session:
+        yield session
+
 class Base(DeclarativeBase):
     pass
\ No newline at end of file
@@ -1,7 +1,6 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import RedirectResponse, JSONResponse
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
@@ -11,6 +10,9 @@ import logging
 import base64
 from datetime import datetime, timedelta
 
+from app.google_api import build_service
+from app.instrumentation import GoogleApiCallsMiddleware, setup_metrics
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,6 +36,8 @@ except Exception as e:
 fernet = Fernet(base64.urlsafe_b64encode(key))
 
 app = FastAPI()
+setup_metrics(app)
+app.add_middleware(GoogleApiCallsMiddleware)
 
 # Настройки OAuth 2.0
 CLIENT_SECRETS_FILE = "client_secrets.json"  # путь к вашему клиентскому секрету OAuth 2.0
@@ -135,7 +139,7 @@ async def list_files():
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     try:
-        service = build('drive', 'v3', credentials=credentials)
+        service = build_service('drive', 'v3', credentials)
         # Ищем начальную папку
         response = service.files().list(
             q="name='Baggins Coffee' and mimeType='application/vnd.google-apps.folder' and trashed=false",
@@ -179,7 +183,7 @@ async def get_file_hierarchy_route(file_id: str):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     try:
-        service = build('drive', 'v3', credentials=credentials)
+        service = build_service('drive', 'v3', credentials)
         hierarchy = get_file_hierarchy(service, file_id)
         return {"hierarchy": hierarchy}
     except Exception as e:
@@ -204,7 +208,7 @@ async def copy_files(email: str):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     try:
-        service = build('drive', 'v3', credentials=credentials)
+        service = build_service('drive', 'v3', credentials)
 
         # Ищем все файлы, владельцем которых является email
         query = f"'{email}' in owners and trashed = false"
@@ -0,0 +1,213 @@
+import email.utils
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from fastapi import HTTPException
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from prometheus_client import Counter, Histogram
+
+from app.instrumentation import count_google_api_call
+
+GOOGLE_API_LATENCY = Histogram(
+    'google_api_request_duration_seconds', 'Outbound Google API call latency', ['api', 'method'],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+GOOGLE_API_CALLS = Counter(
+    'google_api_requests_total', 'Outbound Google API calls', ['api', 'method', 'status']
+)
+GOOGLE_API_ERRORS = Counter(
+    'google_api_errors_total', 'Failed Google API calls by error reason', ['api', 'method', 'reason']
+)
+GOOGLE_API_BYTES = Counter(
+    'google_api_response_bytes_total', 'Bytes received from Google APIs', ['api', 'method']
+)
+GOOGLE_API_LIMITER_WAIT = Histogram(
+    'google_api_limiter_wait_seconds', 'Time a call waited for a rate limiter token', ['api'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+GOOGLE_API_RETRIES = Counter(
+    'google_api_retries_total', 'Retried Google API calls by error reason', ['api', 'method', 'reason']
+)
+
+# Лимиты запросов в секунду на процесс, чуть ниже квот на пользователя: Drive - 12 000 запросов
+# в минуту (200 в секунду), Gmail - 250 единиц в секунду при 5 единицах на messages.list/get.
+# При нескольких воркерах делите квоту на их число; 0 - без лимита
+GOOGLE_API_QPS = {
+    "drive": float(os.getenv("GOOGLE_DRIVE_QPS", 180)),
+    "gmail": float(os.getenv("GOOGLE_GMAIL_QPS", 45)),
+}
+GOOGLE_API_BURST = float(os.getenv("GOOGLE_API_BURST", 5))
+GOOGLE_API_MAX_RETRIES = int(os.getenv("GOOGLE_API_MAX_RETRIES", 5))
+GOOGLE_API_BACKOFF_BASE = float(os.getenv("GOOGLE_API_BACKOFF_BASE", 1))
+GOOGLE_API_BACKOFF_MAX = float(os.getenv("GOOGLE_API_BACKOFF_MAX", 64))
+
+# Корень API для локального стенда (benchmarks/fake_google.py), например http://127.0.0.1:8765/
+GOOGLE_API_ENDPOINT = os.getenv("GOOGLE_API_ENDPOINT")
+# api_endpoint заменяет rootUrl + servicePath из discovery, поэтому servicePath добавляем сами
+SERVICE_PATHS = {"drive": "drive/{version}/", "gmail": ""}
+
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Повтор после 5xx или обрыва соединения безопасен только для чтения
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+
+def error_reason(error):
+    """reason из тела ошибки Google API: rateLimitExceeded, userRateLimitExceeded, notFound..."""
+    try:
+        data = json.loads(error.content.decode("utf-8"))
+        details = data["error"].get("errors") or []
+        return details[0].get("reason") if details else data["error"].get("status") or str(error.resp.status)
+    except (ValueError, KeyError, TypeError, AttributeError, IndexError):
+        return str(error.resp.status)
+
+
+def is_rate_limited(error):
+    if not isinstance(error, HttpError):
+        return False
+    return error.resp.status == 429 or (error.resp.status == 403 and error_reason(error) in RATE_LIMIT_REASONS)
+
+
+def retry_after(error):
+    """Значение Retry-After в секундах (число или HTTP-дата), None если заголовка нет."""
+    value = error.resp.get("retry-after") if isinstance(error, HttpError) else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        try:
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+
+def raise_if_rate_limited(error):
+    """Отдаем клиенту 429 вместо 500, если квота Google так и не освободилась после повторов."""
+    if is_rate_limited(error):
+        delay = retry_after(error) or GOOGLE_API_BACKOFF_MAX
+        raise HTTPException(
+            status_code=429,
+            detail="Google API quota exceeded, retry later",
+            headers={"Retry-After": str(int(delay))},
+        ) from error
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Блокирует поток до появления токена, возвращает время ожидания."""
+        if self.rate <= 0:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Токен резервируется сразу, поэтому ждем вне блокировки и очередь остается честной
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(api):
+    with _limiters_lock:
+        if api not in _limiters:
+            _limiters[api] = TokenBucket(GOOGLE_API_QPS.get(api, 0), GOOGLE_API_BURST)
+        return _limiters[api]
+
+
+class InstrumentedHttpRequest(HttpRequest):
+    """HttpRequest с лимитом QPS, повторами при ошибках квоты и метриками по каждому вызову."""
+
+    def __init__(self, http, postproc, uri, **kwargs):
+        self.response_bytes = 0
+
+        def postproc_with_size(resp, content):
+            self.response_bytes = len(content or b"")
+            return postproc(resp, content)
+
+        super().__init__(http, postproc_with_size, uri, **kwargs)
+
+    def execute(self, http=None, num_retries=0):
+        method = self.methodId or "unknown"
+        api = method.split(".", 1)[0]
+        limiter = get_limiter(api)
+
+        for attempt in range(GOOGLE_API_MAX_RETRIES + 1):
+            GOOGLE_API_LIMITER_WAIT.labels(api=api).observe(limiter.acquire())
+            try:
+                return self._execute_once(api, method, http, num_retries)
+            except Exception as e:
+                reason = self._retry_reason(e)
+                if reason is None or attempt == GOOGLE_API_MAX_RETRIES:
+                    raise
+                # Экспоненциальная задержка с full jitter, но не меньше Retry-After
+                delay = random.uniform(0, min(GOOGLE_API_BACKOFF_MAX, GOOGLE_API_BACKOFF_BASE * 2 ** attempt))
+                delay = max(delay, retry_after(e) or 0)
+                GOOGLE_API_RETRIES.labels(api=api, method=method, reason=reason).inc()
+                logging.warning(f"{method} failed ({reason}), retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _retry_reason(self, error):
+        if isinstance(error, HttpError):
+            if is_rate_limited(error):
+                return error_reason(error)
+            if error.resp.status in RETRYABLE_STATUSES and self.method in IDEMPOTENT_METHODS:
+                return str(error.resp.status)
+            return None
+        if isinstance(error, (ConnectionError, TimeoutError)) and self.method in IDEMPOTENT_METHODS:
+            return type(error).__name__
+        return None
+
+    def _execute_once(self, api, method, http, num_retries):
+        status = "error"
+        start_time = time.perf_counter()
+        try:
+            result = super().execute(http=http, num_retries=num_retries)
+            status = "200"
+            return result
+        except HttpError as e:
+            status = str(e.resp.status)
+            self.response_bytes = len(e.content or b"")
+            GOOGLE_API_ERRORS.labels(api=api, method=method, reason=error_reason(e)).inc()
+            raise
+        except Exception as e:
+            GOOGLE_API_ERRORS.labels(api=api, method=method, reason=type(e).__name__).inc()
+            raise
+        finally:
+            GOOGLE_API_LATENCY.labels(api=api, method=method).observe(time.perf_counter() - start_time)
+            GOOGLE_API_CALLS.labels(api=api, method=method, status=status).inc()
+            GOOGLE_API_BYTES.labels(api=api, method=method).inc(self.response_bytes)
+            count_google_api_call()
+
+
+def build_service(service_name, version, credentials):
+    client_options = None
+    if GOOGLE_API_ENDPOINT:
+        service_path = SERVICE_PATHS.get(service_name, "").format(version=version)
+        client_options = {"api_endpoint": GOOGLE_API_ENDPOINT.rstrip("/") + "/" + service_path}
+    return build(
+        service_name, version,
+        credentials=credentials,
+        requestBuilder=InstrumentedHttpRequest,
+        cache_discovery=False,
+        client_options=client_options,
+    )
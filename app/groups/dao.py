@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from sqlalchemy import delete, select
+
+from app.database import session_scope
+from app.groups.models import GroupMembers, Groups
+
+
+def email_from_href(href):
+    # https://groups.google.com/u/0/g/<slug> -> <slug>@googlegroups.com
+    slug = href.rstrip('/').rsplit('/g/', 1)[-1]
+    return f"{slug}@googlegroups.com"
+
+
+class GroupsDAO:
+    @classmethod
+    async def find_all(cls, session=None):
+        async with session_scope(session) as session:
+            result = await session.execute(select(Groups).order_by(Groups.name))
+            return result.scalars().all()
+
+    @classmethod
+    async def sync(cls, groups, delete_missing=True, session=None):
+        """Приводит таблицу groups к результату парсинга, сохраняя id существующих групп."""
+        scraped = {group["group_href"]: group["group_name"] for group in groups}
+        async with session_scope(session) as session:
+            result = await session.execute(select(Groups).where(Groups.href.is_not(None)))
+            existing = {group.href: group for group in result.scalars()}
+
+            for href, name in scraped.items():
+                group = existing.get(href)
+                if group is None:
+                    session.add(Groups(name=name, email=email_from_href(href), href=href))
+                elif group.name != name:
+                    group.name = name
+
+            stale = [href for href in existing if href not in scraped]
+            if stale and delete_missing:
+                await session.execute(delete(Groups).where(Groups.href.in_(stale)))
+            await session.commit()
+
+
+class GroupMembersDAO:
+    @classmethod
+    async def save_sync_results(cls, results, session=None):
+        """Сохраняет результаты sync_members: участников заменяем только у изменившихся групп."""
+        async with session_scope(session) as session:
+            for result in results:
+                group = await session.get(Groups, result["group_id"])
+                if group is None:
+                    continue
+                if result["members"] is not None:
+                    await session.execute(delete(GroupMembers).where(GroupMembers.group_id == group.id))
+                    session.add_all([
+                        GroupMembers(group_id=group.id, email=member["email"], name=member["name"])
+                        for member in result["members"]
+                    ])
+                    group.member_count = result["member_count"]
+                    group.members_marker = result["marker"]
+                group.members_synced_at = datetime.utcnow()
+            await session.commit()
@@ -1,3 +1,6 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, UniqueConstraint
 from sqlalchemy.orm import mapped_column, Mapped
 from app.database import Base
 
@@ -8,6 +11,24 @@ class Groups(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str]
     email: Mapped[str]
+    href: Mapped[str | None] = mapped_column(unique=True)
+    # Маркеры изменений, по которым синхронизация участников пропускает группу
+    member_count: Mapped[int | None]
+    members_marker: Mapped[str | None]
+    members_synced_at: Mapped[datetime | None]
+
+    def __str__(self):
+        return f"Group {self.name}"
+
+
+class GroupMembers(Base):
+    __tablename__ = "group_members"
+    __table_args__ = (UniqueConstraint("group_id", "email"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    group_id: Mapped[int] = mapped_column(ForeignKey("groups.id", ondelete="CASCADE"), index=True)
+    email: Mapped[str]
+    name: Mapped[str | None]
 
     def __str__(self):
-        return f"Group {self.name}"
\ No newline at end of file
+        return f"Member {self.email}"
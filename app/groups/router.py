@@ -0,0 +1,51 @@
+import hashlib
+import json
+import os
+
+from cachetools import TTLCache
+from fastapi import APIRouter, Request, Response
+
+from app.groups.dao import GroupsDAO
+
+router = APIRouter(prefix="/groups", tags=["Groups"])
+
+# Кэш живет в процессе: после парсинга его сбрасывает invalidate_groups_cache(),
+# а TTL ограничивает устаревание в соседних воркерах
+GROUPS_CACHE_TTL = int(os.getenv("GROUPS_CACHE_TTL", 300))
+_groups_cache = TTLCache(maxsize=1, ttl=GROUPS_CACHE_TTL)
+
+
+def invalidate_groups_cache():
+    _groups_cache.clear()
+
+
+async def get_cached_groups():
+    entry = _groups_cache.get("groups")
+    if entry is None:
+        groups = await GroupsDAO.find_all()
+        body = json.dumps({"groups": [
+            {
+                "id": group.id,
+                "name": group.name,
+                "email": group.email,
+                "href": group.href,
+                "member_count": group.member_count,
+            }
+            for group in groups
+        ]}, ensure_ascii=False).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        entry = (body, etag)
+        _groups_cache["groups"] = entry
+    return entry
+
+
+@router.get("")
+async def get_groups(request: Request):
+    body, etag = await get_cached_groups()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,211 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from app.browser import add_cookies, create_driver, extract_elements, open_page, quit_driver, step
+from app.groups.dao import GroupMembersDAO, GroupsDAO
+from app.groups.router import invalidate_groups_cache
+
+# Сколько браузеров одновременно обходят группы
+GROUPS_SYNC_SESSIONS = int(os.getenv("GROUPS_SYNC_SESSIONS", 4))
+# Подменяется на адрес локального сервера со страницами-фикстурами (tests/fixtures/groups)
+GROUPS_BASE_URL = os.getenv("GROUPS_BASE_URL", "https://groups.google.com").rstrip("/")
+GROUPS_LIST_PATH = os.getenv("GROUPS_LIST_PATH", "/u/1/my-groups")
+GROUPS_CSV = "groups.csv"
+
+MEMBERS_XPATH = "//div[@role='main']//*[@role='row' or self::tr][contains(., '@')]"
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+
+# Число участников из заголовка страницы и Last-Modified, если сервер его отдал
+# (без заголовка document.lastModified равен текущему времени)
+PROBE_MEMBERS_SCRIPT = r"""
+const text = (document.querySelector("[role='main']") || document.body).innerText;
+const match = text.match(/(\d[\d\s,.]*)\s*(?:members?|участник)/i)
+    || text.match(/(?:members|участники)\s*[:(]?\s*(\d[\d\s,.]*)/i);
+const lastModified = Date.parse(document.lastModified);
+return JSON.stringify({
+    count: match ? parseInt(match[1].replace(/\D/g, ''), 10) : null,
+    marker: Math.abs(Date.now() - lastModified) > 5000 ? document.lastModified : null,
+});
+"""
+
+# Число участников каждой группы из списка групп: ключ - имя группы из ссылки .../g/<имя>
+LIST_MEMBER_COUNTS_SCRIPT = r"""
+const counts = {};
+const main = document.querySelector("[role='main']") || document.body;
+for (const row of main.querySelectorAll("[role='row'], tr")) {
+    const link = row.querySelector("a[href*='/g/']");
+    const match = row.innerText.match(/(\d[\d\s,.]*)\s*(?:members?|участник)/i);
+    if (link && match) {
+        counts[link.href.split('/g/')[1].split(/[/?#]/)[0]] = parseInt(match[1].replace(/\D/g, ''), 10);
+    }
+}
+return JSON.stringify(counts);
+"""
+
+
+def group_key(href):
+    return href.rstrip("/").rsplit("/g/", 1)[-1]
+
+
+def members_url(href):
+    return href.rstrip("/").replace("https://groups.google.com", GROUPS_BASE_URL, 1) + "/members"
+
+
+def read_groups_csv(file_path):
+    with open(file_path, newline='') as input_file:
+        return [row for row in csv.DictReader(input_file) if row.get("group_href")]
+
+
+def read_listed_counts(driver):
+    """Число участников групп со страницы списка групп: одна навигация на весь обход."""
+    open_page(driver, GROUPS_BASE_URL + GROUPS_LIST_PATH, "open_groups")
+    with step(driver, "list_member_counts"):
+        WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.XPATH, "//div[@role='main']")))
+        return json.loads(driver.execute_script(LIST_MEMBER_COUNTS_SCRIPT))
+
+
+def split_unchanged(groups, listed_counts):
+    """Делит группы на неизмененные (число участников в списке совпало с сохраненным) и остальные."""
+    unchanged, pending = [], []
+    for group in groups:
+        count = listed_counts.get(group_key(group["href"]))
+        if count is not None and count == group["member_count"]:
+            unchanged.append({"group_id": group["id"], "members": None})
+        else:
+            pending.append(group)
+    return unchanged, pending
+
+
+def fetch_group_members(driver, group):
+    open_page(driver, members_url(group["href"]), "open_members")
+    with step(driver, "probe_members"):
+        WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.XPATH, "//div[@role='main']")))
+        probe = json.loads(driver.execute_script(PROBE_MEMBERS_SCRIPT))
+    if (probe["count"] is not None and probe["count"] == group["member_count"]
+            and probe["marker"] == group["marker"]):
+        logging.info(f"Group {group['href']} unchanged ({probe['count']} members), skipped")
+        return {"group_id": group["id"], "members": None}
+
+    with step(driver, "extract_members"):
+        rows = extract_elements(driver, MEMBERS_XPATH)
+
+    members = {}
+    for row in rows:
+        match = EMAIL_RE.search(row["text"])
+        if not match:
+            continue
+        email = match.group(0).lower()
+        name = row["text"].replace(match.group(0), "").strip().split("\n")[0].strip()
+        members.setdefault(email, {"email": email, "name": name or None})
+
+    logging.info(f"Group {group['href']}: {len(members)} members fetched")
+    return {
+        "group_id": group["id"],
+        "members": list(members.values()),
+        "member_count": probe["count"] if probe["count"] is not None else len(members),
+        "marker": probe["marker"],
+    }
+
+
+def start_session(cookies_path):
+    driver = create_driver("groups_sync", headless=True)
+    try:
+        if cookies_path and os.path.exists(cookies_path):
+            open_page(driver, GROUPS_BASE_URL, "open_cookie_domain")
+            with step(driver, "load_cookies"):
+                add_cookies(driver, cookies_path)
+    except Exception:
+        quit_driver(driver)
+        raise
+    return driver
+
+
+def _sync_worker(tasks, results, cookies_path, driver=None):
+    # Один браузер на воркер, переиспользуется для всех взятых из очереди групп
+    driver = driver or start_session(cookies_path)
+    try:
+        while True:
+            try:
+                group = tasks.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results.append(fetch_group_members(driver, group))
+            except Exception as e:
+                logging.error(f"Failed to sync members of {group['href']}: {e}")
+    finally:
+        quit_driver(driver)
+
+
+def sync_members(groups, cookies_path="cookies.pkl", sessions=GROUPS_SYNC_SESSIONS):
+    """Обходит группы параллельно не более чем в sessions браузерах.
+
+    Сначала читает число участников со страницы списка групп: группы, у которых
+    оно не изменилось, пропускаются без открытия их страниц.
+    """
+    if not groups:
+        return []
+    driver = start_session(cookies_path)
+    try:
+        listed_counts = read_listed_counts(driver)
+    except Exception as e:
+        logging.warning(f"Failed to read member counts from the groups list, probing every group: {e}")
+        listed_counts = {}
+    results, pending = split_unchanged(groups, listed_counts)
+    if results:
+        logging.info(f"{len(results)} groups unchanged in the groups list, skipped")
+    if not pending:
+        quit_driver(driver)
+        return results
+
+    tasks = queue.Queue()
+    for group in pending:
+        tasks.put(group)
+
+    workers = max(1, min(sessions, len(pending)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Браузер, открывший список групп, становится первым воркером
+        futures = [pool.submit(_sync_worker, tasks, results, cookies_path, driver)]
+        futures += [pool.submit(_sync_worker, tasks, results, cookies_path) for _ in range(workers - 1)]
+        for future in futures:
+            future.result()
+    return results
+
+
+async def run_members_sync(cookies_path="cookies.pkl"):
+    if os.path.exists(GROUPS_CSV):
+        await GroupsDAO.sync(read_groups_csv(GROUPS_CSV), delete_missing=False)
+
+    groups = [
+        {"id": group.id, "href": group.href, "member_count": group.member_count, "marker": group.members_marker}
+        for group in await GroupsDAO.find_all() if group.href
+    ]
+    results = await asyncio.to_thread(sync_members, groups, cookies_path)
+    await GroupMembersDAO.save_sync_results(results)
+    invalidate_groups_cache()
+
+    changed = sum(result["members"] is not None for result in results)
+    summary = {
+        "groups": len(groups),
+        "changed": changed,
+        "skipped": len(results) - changed,
+        "failed": len(groups) - len(results),
+    }
+    logging.info(f"Group members sync finished: {summary}")
+    return summary
+
+
+if __name__ == "__main__":
+    # Запуск: python -m app.groups.sync
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_members_sync())
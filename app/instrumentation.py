@@ -0,0 +1,191 @@
+import atexit
+import contextvars
+import glob
+import logging
+import os
+import time
+
+# В мультипроцессном режиме (несколько воркеров uvicorn) каждый процесс пишет
+# значения в файлы PROMETHEUS_MULTIPROC_DIR, а /metrics собирает их все.
+# Каталог должен существовать до создания первой метрики.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from starlette.responses import Response
+from starlette.routing import Match
+
+from app.loop_monitor import setup_loop_monitor, track_route
+
+
+def _buckets(name, default):
+    # Например METRICS_LATENCY_BUCKETS=0.1,0.5,1,5
+    value = os.getenv(name)
+    return tuple(float(bucket) for bucket in value.split(",")) if value else default
+
+
+LATENCY_BUCKETS = _buckets(
+    "METRICS_LATENCY_BUCKETS",
+    (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+SIZE_BUCKETS = _buckets(
+    "METRICS_SIZE_BUCKETS",
+    (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000),
+)
+
+# endpoint - шаблон маршрута (/file-hierarchy/{file_id}), а не сырой путь,
+# чтобы число временных рядов не росло с каждым новым id
+REQUEST_COUNT = Counter(
+    'http_requests_total', 'Total number of HTTP requests', ['method', 'endpoint', 'status']
+)
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ['method', 'endpoint', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'HTTP requests currently being served', ['method', 'endpoint'],
+    multiprocess_mode='livesum',
+)
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'HTTP response body size', ['method', 'endpoint'],
+    buckets=SIZE_BUCKETS,
+)
+
+GOOGLE_API_CALLS_PER_REQUEST = Histogram(
+    'google_api_calls_per_request', 'Google API calls made while serving one HTTP request', ['endpoint'],
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000),
+)
+
+UNMATCHED_ENDPOINT = "<unmatched>"
+
+# Счетчик вызовов Google API текущего входящего запроса; список, чтобы его можно
+# было увеличивать из скопированного контекста (run_in_threadpool, to_thread)
+_google_api_calls = contextvars.ContextVar("google_api_calls_in_request", default=None)
+
+
+def route_template(scope):
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return getattr(route, "path", UNMATCHED_ENDPOINT)
+    return UNMATCHED_ENDPOINT
+
+
+class PrometheusMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        endpoint = route_template(scope)
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method=method, endpoint=endpoint)
+        in_progress.inc()
+        start_time = time.perf_counter()
+        try:
+            with track_route(endpoint):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            latency = time.perf_counter() - start_time
+            in_progress.dec()
+            REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=status).inc()
+            REQUEST_LATENCY.labels(method=method, endpoint=endpoint, status=status).observe(latency)
+            RESPONSE_SIZE.labels(method=method, endpoint=endpoint).observe(size)
+
+
+def count_google_api_call():
+    calls = _google_api_calls.get()
+    if calls is not None:
+        calls[0] += 1
+
+
+class GoogleApiCallsMiddleware:
+    """Считает, сколько вызовов Google API понадобилось на один входящий запрос.
+
+    Живет здесь, а не в app.google_api, чтобы подключение middleware
+    не тянуло googleapiclient при старте приложения.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        calls = [0]
+        token = _google_api_calls.set(calls)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _google_api_calls.reset(token)
+            if calls[0]:
+                GOOGLE_API_CALLS_PER_REQUEST.labels(endpoint=route_template(scope)).observe(calls[0])
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def cleanup_dead_workers():
+    """Убирает live-гейджи завершившихся воркеров, чтобы они не попадали в livesum."""
+    if not MULTIPROC_DIR:
+        return
+    pids = set()
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, "*.db")):
+        # counter_123.db, gauge_livesum_123.db
+        try:
+            pids.add(int(os.path.basename(path)[:-len(".db")].rsplit("_", 1)[1]))
+        except (IndexError, ValueError):
+            continue
+    for pid in pids:
+        if pid != os.getpid() and not _pid_alive(pid):
+            multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
+            logging.info(f"Removed live metrics of dead worker {pid}")
+
+
+def _mark_current_process_dead():
+    multiprocess.mark_process_dead(os.getpid(), MULTIPROC_DIR)
+
+
+async def metrics():
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=MULTIPROC_DIR)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def setup_metrics(app):
+    """Подключает HTTP-метрики, /metrics и монитор event loop к приложению."""
+    app.add_middleware(PrometheusMiddleware)
+    setup_loop_monitor(app)
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+    if MULTIPROC_DIR:
+        app.add_event_handler("startup", cleanup_dead_workers)
+        atexit.register(_mark_current_process_dead)
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Histogram
+
+# Как часто мерить задержку event loop и с какой задержки считать его заблокированным
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR", "1") != "0"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.1))
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", 0.5))
+
+EVENT_LOOP_LAG = Histogram(
+    'event_loop_lag_seconds', 'Delay of a scheduled event loop wakeup past its deadline',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+EVENT_LOOP_BLOCKS = Counter(
+    'event_loop_blocks_total', 'Times the event loop was blocked longer than the threshold', ['endpoint']
+)
+
+NO_ROUTE = "<none>"
+STACK_LIMIT = 25
+
+# Задача -> маршрут, который она обслуживает; читается из потока watchdog
+_task_routes = {}
+
+
+@contextmanager
+def track_route(route):
+    task = asyncio.current_task()
+    _task_routes[task] = route
+    try:
+        yield
+    finally:
+        _task_routes.pop(task, None)
+
+
+def describe_task(task):
+    if task is None:
+        return NO_ROUTE
+    route = _task_routes.get(task)
+    if route:
+        return route
+    # Задачи без маршрута: фоновые обновления кэша, single-flight, планировщик
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", task.get_name())
+
+
+class LoopMonitor:
+    """Меряет задержку event loop и ловит блокирующие вызовы.
+
+    Задача-пульс засыпает на interval и записывает, насколько проснулась позже.
+    Поток watchdog проверяет пульс: если его нет дольше threshold, в лог пишется
+    текущий стек потока event loop и маршрут выполняемой задачи.
+    """
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL, threshold=LOOP_BLOCK_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._loop = None
+        self._loop_thread_id = None
+        self._heartbeat = time.monotonic()
+        self._beat_task = None
+        self._stopped = threading.Event()
+        self._watchdog = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._beat_task = self._loop.create_task(self._beat(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._beat_task:
+            self._beat_task.cancel()
+
+    async def _beat(self):
+        while True:
+            start_time = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            EVENT_LOOP_LAG.observe(max(0.0, now - start_time - self.interval))
+            self._heartbeat = now
+
+    def _watch(self):
+        reported = False
+        while not self._stopped.wait(min(self.interval, self.threshold / 2)):
+            blocked_for = time.monotonic() - self._heartbeat - self.interval
+            if blocked_for < self.threshold:
+                reported = False
+                continue
+            # Один отчет на эпизод блокировки: стек снимаем, пока loop еще занят
+            if not reported:
+                reported = True
+                self._report(blocked_for)
+
+    def _report(self, blocked_for):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        # Внутренние кадры - блокирующий вызов и обработчик; внешние - стек uvicorn/starlette
+        stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame else "<no frame>\n"
+        route = describe_task(asyncio.current_task(self._loop))
+        EVENT_LOOP_BLOCKS.labels(endpoint=route).inc()
+        logging.warning(f"Event loop blocked for {blocked_for:.2f}s+ in {route}, stack:\n{stack}")
+
+
+def setup_loop_monitor(app):
+    if not LOOP_MONITOR_ENABLED:
+        return
+    monitor = LoopMonitor()
+    app.state.loop_monitor = monitor
+    app.add_event_handler("startup", monitor.start)
+    app.add_event_handler("shutdown", monitor.stop)
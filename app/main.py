@@ -1,10 +1,7 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import asyncio
@@ -15,13 +12,41 @@ import csv
 import pickle
 import os
 
+from app.admission import AdmissionLimit
+from app.browser import add_cookies, create_driver, extract_elements, open_page, quit_driver, step
+from app.groups.dao import GroupsDAO
+from app.groups.router import router as groups_router, invalidate_groups_cache
+from app.groups.sync import run_members_sync
+from app.instrumentation import setup_metrics
+
 logging.basicConfig(level=logging.INFO)
 app = FastAPI()
+setup_metrics(app)
+app.include_router(groups_router)
+
+# Не даем запустить несколько Chrome-парсингов групп одновременно
+groups_refresh_lock = asyncio.Lock()
+members_sync_lock = asyncio.Lock()
+# Запущенные фоновые задачи по имени. Проверка и запуск идут без await между ними,
+# поэтому параллельный запрос уже видит задачу и не запускает вторую
+background_jobs = {}
+
+# Каждый запрос запускает Chrome: ограничиваем их число, лишние получают 503
+authenticate_admission = AdmissionLimit("authenticate", limit=2, queue_size=2, timeout=60, retry_after=60)
+parse_groups_admission = AdmissionLimit("parse-groups", limit=1, queue_size=2, timeout=120, retry_after=60)
 
 class LoginRequest(BaseModel):
     email: str
     password: str
 
+def start_background_job(name, coro_func, *args):
+    """Запускает задачу, если задача с этим именем еще не идет; False, если уже идет."""
+    task = background_jobs.get(name)
+    if task is not None and not task.done():
+        return False
+    background_jobs[name] = asyncio.create_task(coro_func(*args))
+    return True
+
 def save_to_csv(groups, file_path):
     keys = groups[0].keys()
     with open(file_path, 'w', newline='') as output_file:
@@ -31,74 +56,58 @@ def save_to_csv(groups, file_path):
     logging.info(f"Groups saved to {file_path}")
 
 def authenticate_and_save_cookies(email, password):
-    service = Service(ChromeDriverManager().install())
-    options = webdriver.ChromeOptions()
-    # options.add_argument("--headless")  # Уберите headless для отладки
-    options.add_argument("--disable-dev-shm-usage")
-
-    driver = webdriver.Chrome(service=service, options=options)
-    logging.info("Chrome driver initialized.")
+    driver = create_driver("authenticate", headless=False)
 
     try:
         # Авторизация в Google-аккаунте
-        driver.get("https://accounts.google.com/signin")
+        open_page(driver, "https://accounts.google.com/signin", "open_signin")
         logging.info("Navigating to Google Sign-In page")
         wait = WebDriverWait(driver, 30)
         
-        email_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='email']")))
-        email_input.send_keys(email)
-        email_input.send_keys(Keys.RETURN)
+        with step(driver, "enter_email"):
+            email_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='email']")))
+            email_input.send_keys(email)
+            email_input.send_keys(Keys.RETURN)
         logging.info("Email entered.")
         time.sleep(2)
 
-        password_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='password']")))
-        password_input.send_keys(password)
-        password_input.send_keys(Keys.RETURN)
+        with step(driver, "enter_password"):
+            password_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='password']")))
+            password_input.send_keys(password)
+            password_input.send_keys(Keys.RETURN)
         logging.info("Password entered.")
         time.sleep(5)
 
         # Переход на страницу групп для установки домена
-        driver.get("https://groups.google.com/u/1/my-groups")
+        open_page(driver, "https://groups.google.com/u/1/my-groups", "open_groups")
         time.sleep(5)
 
         # Сохранение куки после успешной авторизации
-        cookies = driver.get_cookies()
-        cookies_path = "cookies.pkl"
-        with open(cookies_path, 'wb') as f:
-            pickle.dump(cookies, f)
+        with step(driver, "save_cookies"):
+            cookies = driver.get_cookies()
+            cookies_path = "cookies.pkl"
+            with open(cookies_path, 'wb') as f:
+                pickle.dump(cookies, f)
         logging.info(f"Cookies saved to {cookies_path}")
 
         return cookies_path
     finally:
-        driver.quit()
-        logging.info("Chrome driver quit.")
+        quit_driver(driver)
 
 def parse_groups_with_cookies(cookies_path):
-    service = Service(ChromeDriverManager().install())
-    options = webdriver.ChromeOptions()
-    # options.add_argument("--headless")  # Уберите headless для отладки
-    options.add_argument("--disable-dev-shm-usage")
-
-    driver = webdriver.Chrome(service=service, options=options)
-    logging.info("Chrome driver initialized.")
+    driver = create_driver("parse_groups", headless=False)
 
     try:
         # Загрузка страницы для установки домена куки
-        driver.get("https://groups.google.com/u/1/my-groups")
+        open_page(driver, "https://groups.google.com/u/1/my-groups", "open_cookie_domain")
         time.sleep(5)
 
         # Загрузка куки
-        with open(cookies_path, 'rb') as f:
-            cookies = pickle.load(f)
-            for cookie in cookies:
-                # Удаляем 'expiry' если она есть, т.к. она мешает установке куки
-                if 'expiry' in cookie:
-                    del cookie['expiry']
-                driver.add_cookie(cookie)
-        logging.info("Cookies loaded into the browser.")
+        with step(driver, "load_cookies"):
+            add_cookies(driver, cookies_path)
 
         # Переход на страницу групп после загрузки куки
-        driver.get("https://groups.google.com/u/1/my-groups")
+        open_page(driver, "https://groups.google.com/u/1/my-groups", "open_groups")
         logging.info("Navigated to Google Groups.")
         time.sleep(10)  # Увеличено время ожидания загрузки страницы
 
@@ -113,18 +122,15 @@ def parse_groups_with_cookies(cookies_path):
 
         # Парсинг названий групп
         wait = WebDriverWait(driver, 30)
-        group_elements = wait.until(EC.presence_of_all_elements_located((By.XPATH, "//a[contains(@href, './g/') and .//div[contains(text(), 'Отдел')]]")))
-
-        # Парсинг данных
-        groups = []
-        for group_element in group_elements:
-            group_name = group_element.text
-            group_href = group_element.get_attribute("href")
-            group_info = {
-                "group_name": group_name,
-                "group_href": group_href,
-            }
-            groups.append(group_info)
+        groups_xpath = "//a[contains(@href, './g/') and .//div[contains(text(), 'Отдел')]]"
+        with step(driver, "extract_groups"):
+            wait.until(EC.presence_of_element_located((By.XPATH, groups_xpath)))
+
+            # Парсинг данных: имена и ссылки всех групп за один вызов на экран списка
+            groups = [
+                {"group_name": element["text"], "group_href": element["href"]}
+                for element in extract_elements(driver, groups_xpath)
+            ]
 
         # Сохранение данных в CSV файл
         if groups:
@@ -134,8 +140,7 @@ def parse_groups_with_cookies(cookies_path):
 
         return groups
     finally:
-        driver.quit()
-        logging.info("Chrome driver quit.")
+        quit_driver(driver)
 
 async def background_authenticate_task(email, password):
     loop = asyncio.get_event_loop()
@@ -149,7 +154,22 @@ async def background_parse_task(cookies_path):
         groups = await loop.run_in_executor(pool, parse_groups_with_cookies, cookies_path)
         return groups
 
-@app.post("/authenticate/")
+async def refresh_groups(cookies_path):
+    async with groups_refresh_lock:
+        groups = await background_parse_task(cookies_path)
+        if groups:
+            await GroupsDAO.sync(groups)
+        invalidate_groups_cache()
+        logging.info(f"Groups table refreshed: {len(groups)} groups")
+        return groups
+
+async def refresh_groups_in_background(cookies_path):
+    try:
+        await refresh_groups(cookies_path)
+    except Exception as e:
+        logging.error(f"Background groups refresh failed: {str(e)}")
+
+@app.post("/authenticate/", dependencies=[Depends(authenticate_admission)])
 async def authenticate(request: LoginRequest):
     try:
         cookies_path = await background_authenticate_task(request.email, request.password)
@@ -158,17 +178,42 @@ async def authenticate(request: LoginRequest):
         logging.error(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/parse-groups/")
+@app.get("/parse-groups/", dependencies=[Depends(parse_groups_admission)])
 async def parse_groups():
     try:
         cookies_path = "cookies.pkl"  # Загрузка куки из сохраненного файла
         if not os.path.exists(cookies_path):
             raise HTTPException(status_code=400, detail="No cookies found. Please authenticate first.")
-        groups = await background_parse_task(cookies_path)
+        groups = await refresh_groups(cookies_path)
         return {"groups": groups}
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/groups/refresh", status_code=202)
+async def refresh_groups_route():
+    cookies_path = "cookies.pkl"
+    if not os.path.exists(cookies_path):
+        raise HTTPException(status_code=400, detail="No cookies found. Please authenticate first.")
+    # Блокировку может держать синхронный /parse-groups
+    if groups_refresh_lock.locked() or not start_background_job("groups-refresh", refresh_groups_in_background, cookies_path):
+        return {"message": "Groups refresh already in progress"}
+    return {"message": "Groups refresh started"}
+
+async def sync_members_in_background(cookies_path):
+    async with members_sync_lock:
+        try:
+            await run_members_sync(cookies_path)
+        except Exception as e:
+            logging.error(f"Group members sync failed: {str(e)}")
+
+@app.post("/groups/sync-members", status_code=202)
+async def sync_members_route():
+    if not start_background_job("members-sync", sync_members_in_background, "cookies.pkl"):
+        return {"message": "Group members sync already in progress"}
+    return {"message": "Group members sync started"}
+
 # Запуск приложения
 # Запуск: uvicorn main:app --reload
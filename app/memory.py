@@ -0,0 +1,158 @@
+import asyncio
+import linecache
+import logging
+import os
+import resource
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from fastapi import Depends
+from prometheus_client import Gauge, Histogram
+
+from app.instrumentation import route_template
+from app.profiling import DEBUG_PREFIX, require_admin
+
+# tracemalloc замедляет аллокации в разы, поэтому включается только явно
+MEMORY_TRACKING = os.getenv("MEMORY_TRACKING", "0") == "1"
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", 10))
+
+MEMORY_BUCKETS = tuple(mb * 2**20 for mb in (1, 4, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096))
+
+PEAK_RSS = Gauge('process_peak_rss_bytes', 'Peak resident set size of the process', multiprocess_mode='max')
+PYTHON_HEAP_PEAK = Gauge(
+    'python_heap_peak_bytes', 'Peak Python heap traced by tracemalloc', multiprocess_mode='max'
+)
+OPERATION_HEAP_PEAK = Histogram(
+    'memory_operation_heap_peak_bytes', 'Python heap growth at its peak during a crawl or request', ['operation'],
+    buckets=MEMORY_BUCKETS,
+)
+OPERATION_RSS_GROWTH = Histogram(
+    'memory_operation_rss_growth_bytes', 'RSS growth over a crawl or request', ['operation'],
+    buckets=MEMORY_BUCKETS,
+)
+
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def peak_rss():
+    # ru_maxrss в Linux - в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def start_tracing():
+    if MEMORY_TRACKING and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+
+# Пик кучи за все время: tracemalloc.reset_peak() сбрасывает пик tracemalloc
+_heap_peak = 0
+# Число идущих операций; пик сбрасывается, только когда других операций нет
+_active_operations = 0
+_operations_lock = threading.Lock()
+
+
+def update_memory_gauges():
+    global _heap_peak
+    PEAK_RSS.set(peak_rss())
+    if tracemalloc.is_tracing():
+        _heap_peak = max(_heap_peak, tracemalloc.get_traced_memory()[1])
+        PYTHON_HEAP_PEAK.set(_heap_peak)
+
+
+@contextmanager
+def track_memory(operation):
+    """Сколько памяти заняла операция: рост Python-кучи на пике и рост RSS.
+
+    Пик tracemalloc общий на процесс, поэтому при параллельных операциях
+    значения завышены - это верхняя оценка.
+    """
+    global _active_operations
+    if not tracemalloc.is_tracing():
+        yield
+        return
+
+    with _operations_lock:
+        if not _active_operations:
+            # Сохраняем пик процесса до сброса, иначе он потеряется
+            update_memory_gauges()
+            tracemalloc.reset_peak()
+        _active_operations += 1
+    heap_before = tracemalloc.get_traced_memory()[0]
+    rss_before = current_rss()
+    try:
+        yield
+    finally:
+        with _operations_lock:
+            _active_operations -= 1
+        heap_peak = tracemalloc.get_traced_memory()[1] - heap_before
+        rss_growth = current_rss() - rss_before
+        OPERATION_HEAP_PEAK.labels(operation=operation).observe(max(0, heap_peak))
+        OPERATION_RSS_GROWTH.labels(operation=operation).observe(max(0, rss_growth))
+        update_memory_gauges()
+        logging.info(f"Memory of {operation}: heap peak +{heap_peak / 2**20:.1f} MiB, RSS {rss_growth / 2**20:+.1f} MiB")
+
+
+class MemoryMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(DEBUG_PREFIX):
+            await self.app(scope, receive, send)
+            return
+        with track_memory(f"{scope['method']} {route_template(scope)}"):
+            await self.app(scope, receive, send)
+        PEAK_RSS.set(peak_rss())
+
+
+def top_allocations(limit, group_by):
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    sites = []
+    for stat in snapshot.statistics(group_by)[:limit]:
+        frames = stat.traceback if group_by == "traceback" else stat.traceback[:1]
+        sites.append({
+            "size_bytes": stat.size,
+            "count": stat.count,
+            "traceback": [
+                f"{frame.filename}:{frame.lineno} {linecache.getline(frame.filename, frame.lineno).strip()}"
+                for frame in frames
+            ],
+        })
+    return sites
+
+
+async def memory_report(limit: int = 20, group_by: str = "lineno", _: None = Depends(require_admin)):
+    report = {"rss_bytes": current_rss(), "peak_rss_bytes": peak_rss(), "tracing": tracemalloc.is_tracing()}
+    if not tracemalloc.is_tracing():
+        report["message"] = "tracemalloc is off, set MEMORY_TRACKING=1"
+        return report
+
+    update_memory_gauges()
+    current = tracemalloc.get_traced_memory()[0]
+    group_by = group_by if group_by in ("lineno", "filename", "traceback") else "lineno"
+    # Снимок всех трасс - долгая операция, не держим на ней event loop
+    report.update({
+        "heap_bytes": current,
+        "heap_peak_bytes": _heap_peak,
+        "top": await asyncio.to_thread(top_allocations, min(limit, 200), group_by),
+    })
+    return report
+
+
+def setup_memory_tracking(app):
+    """Пиковый RSS на каждом запросе; с MEMORY_TRACKING=1 еще tracemalloc и /debug/memory."""
+    app.add_middleware(MemoryMiddleware)
+    app.add_api_route(DEBUG_PREFIX + "memory", memory_report, methods=["GET"], include_in_schema=False)
+    app.add_event_handler("startup", start_tracing)
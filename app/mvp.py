@@ -1,10 +1,7 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import asyncio
@@ -12,42 +9,45 @@ from concurrent.futures import ThreadPoolExecutor
 import time
 import logging
 
+from app.admission import AdmissionLimit
+from app.browser import create_driver, extract_elements, open_page, quit_driver, step
+from app.instrumentation import setup_metrics
+
 logging.basicConfig(level=logging.INFO)
 app = FastAPI()
+setup_metrics(app)
+
+# Каждый запрос запускает Chrome: ограничиваем их число, лишние получают 503
+get_groups_admission = AdmissionLimit("get-groups", limit=2, queue_size=2, timeout=60, retry_after=60)
 
 class LoginRequest(BaseModel):
     email: str
     password: str
 
 def run_selenium_task(email, password):
-    service = Service(ChromeDriverManager().install())
-    options = webdriver.ChromeOptions()
-    # options.add_argument("--headless")  # Уберите headless для отладки
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-
-    driver = webdriver.Chrome(service=service, options=options)
-    logging.info("Chrome driver initialized.")
+    driver = create_driver("get_groups", headless=False, extra_args=["--no-sandbox"])
 
     try:
         # Авторизация в Google-аккаунте
-        driver.get("https://accounts.google.com/signin")
+        open_page(driver, "https://accounts.google.com/signin", "open_signin")
         wait = WebDriverWait(driver, 30)
         
-        email_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='email']")))
-        email_input.send_keys(email)
-        email_input.send_keys(Keys.RETURN)
+        with step(driver, "enter_email"):
+            email_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='email']")))
+            email_input.send_keys(email)
+            email_input.send_keys(Keys.RETURN)
         logging.info("Email entered.")
         time.sleep(2)
 
-        password_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='password']")))
-        password_input.send_keys(password)
-        password_input.send_keys(Keys.RETURN)
+        with step(driver, "enter_password"):
+            password_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='password']")))
+            password_input.send_keys(password)
+            password_input.send_keys(Keys.RETURN)
         logging.info("Password entered.")
         time.sleep(5)
 
         # Переход на страницу групп
-        driver.get("https://groups.google.com/u/1/my-groups")
+        open_page(driver, "https://groups.google.com/u/1/my-groups", "open_groups")
         logging.info("Navigated to Google Groups.")
         time.sleep(5)  # Ожидание загрузки страницы
 
@@ -64,8 +64,10 @@ def run_selenium_task(email, password):
                 main_div = wait.until(EC.visibility_of_element_located((By.XPATH, "//div[@role='main']")))
                 logging.info("Main div found.")
                 
-                group_elements = wait.until(EC.visibility_of_all_elements_located((By.XPATH, "//div[@role='main']//tr/td[1]//span[@role='link']")))
-                group_names = [group.text for group in group_elements]
+                groups_xpath = "//div[@role='main']//tr/td[1]//span[@role='link']"
+                with step(driver, "extract_groups"):
+                    wait.until(EC.visibility_of_element_located((By.XPATH, groups_xpath)))
+                    group_names = [element["text"] for element in extract_elements(driver, groups_xpath)]
                 logging.info(f"Groups found: {group_names}")
 
                 return group_names
@@ -79,8 +81,7 @@ def run_selenium_task(email, password):
         logging.error(f"Error during selenium task: {e}")
         raise
     finally:
-        driver.quit()
-        logging.info("Chrome driver quit.")
+        quit_driver(driver)
 
 async def background_selenium_task(email, password):
     loop = asyncio.get_event_loop()
@@ -88,7 +89,7 @@ async def background_selenium_task(email, password):
         group_names = await loop.run_in_executor(pool, run_selenium_task, email, password)
         return group_names
 
-@app.post("/get-groups/")
+@app.post("/get-groups/", dependencies=[Depends(get_groups_admission)])
 async def get_groups(request: LoginRequest):
     try:
         group_names = await background_selenium_task(request.email, request.password)
@@ -0,0 +1,198 @@
+import hmac
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import FileResponse
+
+from app.instrumentation import route_template
+
+# Профилирование запроса по требованию: заголовок X-Profile-Token или параметр
+# ?profile=<токен>. Без PROFILING_TOKEN функция выключена.
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", 0.005))
+# Доля времени, которую сэмплер может тратить на обход стеков
+PROFILING_MAX_OVERHEAD = float(os.getenv("PROFILING_MAX_OVERHEAD", 0.05))
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", 120))
+# Не чаще одного профиля за столько секунд
+PROFILING_MIN_INTERVAL = float(os.getenv("PROFILING_MIN_INTERVAL", 10))
+
+DEBUG_PREFIX = "/debug/"
+
+# Верхние кадры простаивающих потоков: пул to_thread, select event loop, watchdog
+IDLE_FRAMES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"),
+               ("threading.py", "_wait_for_tstate_lock")}
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """Сэмплирующий профайлер всех потоков процесса в формате collapsed stacks.
+
+    Работа запроса идет и в потоке event loop, и в потоках to_thread, поэтому
+    снимаются стеки всех потоков, кроме простаивающих. Интервал растет, если
+    обход стеков занимает больше max_overhead от времени работы.
+    """
+
+    def __init__(self, interval=PROFILING_INTERVAL, max_overhead=PROFILING_MAX_OVERHEAD,
+                 max_seconds=PROFILING_MAX_SECONDS):
+        self.interval = interval
+        self.max_overhead = max_overhead
+        self.max_seconds = max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self.truncated = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + self.max_seconds
+        delay = self.interval
+        while not self._stopped.wait(delay):
+            if time.monotonic() > deadline:
+                self.truncated = True
+                return
+            start_time = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                self.stacks[";".join([names.get(ident, str(ident)), *reversed(stack)])] += 1
+            self.samples += 1
+            delay = max(self.interval, (time.perf_counter() - start_time) / self.max_overhead)
+
+    def write(self, path):
+        with open(path, "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class ProfileGate:
+    """Не больше одного профиля одновременно и не чаще min_interval."""
+
+    def __init__(self, min_interval=PROFILING_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._busy = False
+        self._last_started = float("-inf")
+
+    def acquire(self):
+        with self._lock:
+            if self._busy or time.monotonic() - self._last_started < self.min_interval:
+                return False
+            self._busy = True
+            self._last_started = time.monotonic()
+            return True
+
+    def release(self):
+        with self._lock:
+            self._busy = False
+
+
+_gate = ProfileGate()
+
+
+def _is_admin(token):
+    return bool(PROFILING_TOKEN and token and hmac.compare_digest(token, PROFILING_TOKEN))
+
+
+def _request_token(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"x-profile-token":
+            return value.decode("latin-1")
+    query = scope.get("query_string", b"").decode("latin-1")
+    match = re.search(r"(?:^|&)profile=([^&]*)", query)
+    return match.group(1) if match else None
+
+
+class ProfilingMiddleware:
+    """Профилирует отдельный запрос, если он пришел с токеном администратора.
+
+    Профиль сохраняется в PROFILE_DIR, имя файла возвращается в заголовке
+    X-Profile; скачать его можно через /debug/profiles/{name} с тем же токеном.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(DEBUG_PREFIX) or not _is_admin(_request_token(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        if not _gate.acquire():
+            await self.app(scope, receive, self._with_header(send, "busy"))
+            return
+
+        endpoint = route_template(scope)
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", endpoint).strip("-") or "root"
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{slug}.collapsed"
+        sampler = StackSampler()
+        start_time = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, self._with_header(send, name))
+        finally:
+            sampler.stop()
+            _gate.release()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            sampler.write(os.path.join(PROFILE_DIR, name))
+            logging.info(
+                f"Profiled {scope['method']} {endpoint} for {time.perf_counter() - start_time:.2f}s: "
+                f"{sampler.samples} samples{' (truncated)' if sampler.truncated else ''}, saved {name}"
+            )
+
+    @staticmethod
+    def _with_header(send, value):
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profile", value.encode())]
+            await send(message)
+        return send_wrapper
+
+
+def require_admin(request: Request):
+    """Зависимость для отладочных эндпоинтов: тот же токен, что и для профилирования."""
+    token = request.headers.get("x-profile-token") or request.query_params.get("profile")
+    if not _is_admin(token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+async def get_profile(name: str, _: None = Depends(require_admin)):
+    path = os.path.join(PROFILE_DIR, os.path.basename(name))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain")
+
+
+def setup_profiling(app):
+    """Подключает профилирование по требованию; без PROFILING_TOKEN ничего не делает."""
+    if not PROFILING_TOKEN:
+        return
+    app.add_middleware(ProfilingMiddleware)
+    app.add_api_route(DEBUG_PREFIX + "profiles/{name}", get_profile, methods=["GET"], include_in_schema=False)
@@ -1,35 +1,33 @@
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi import APIRouter, FastAPI, Request, HTTPException, BackgroundTasks
 from fastapi.responses import RedirectResponse, JSONResponse
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import os
 import json
 import logging
 import base64
+import hashlib
 from datetime import datetime, timedelta
 import time
+import threading
 import imaplib
 from email.header import decode_header
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 import asyncio
-from prometheus_client import start_http_server, Summary, Counter, Histogram, generate_latest, REGISTRY
-from prometheus_client.core import CollectorRegistry
-from starlette.responses import Response
-
-#создаем метрики
-REQUEST_COUNT = Counter('http_requests_total', 'Total number of HTTP requests', ['method', 'endpoint'])
-REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency', ['method', 'endpoint'])
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache, cached
+
+# Selenium (app.browser), googleapiclient (app.google_api), google_auth_oauthlib
+# и APScheduler импортируются при первом использовании: они заметно замедляют
+# старт воркера, а нужны только части запросов. Проверка: python benchmarks/startup.py
+from app.admission import ADMISSION_REJECTED, AdmissionLimit
+from app.cache import HIT, MISS, STALE, StaleWhileRevalidateCache
+from app.crawler import FolderCrawl
+from app.credentials_file import CREDENTIALS_REFRESHES, CredentialsFile, needs_refresh, refresh_credentials
+from app.instrumentation import GoogleApiCallsMiddleware, setup_metrics
+from app.memory import setup_memory_tracking, track_memory
+from app.profiling import setup_profiling
+from app.singleflight import SingleFlight
+from app.subtree_copy import COPY_SOURCE_PROPERTY, SUBTREE_COPY_MAX_JOBS, SubtreeCopyJob, get_job, submit_job
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -53,24 +51,84 @@ except Exception as e:
 
 fernet = Fernet(base64.urlsafe_b64encode(key))
 
-app = FastAPI()
+# Одновременные одинаковые запросы к тяжелым эндпоинтам выполняются один раз
+flights = SingleFlight()
+
+# /files: свежий результат FILES_CACHE_TTL секунд, затем еще FILES_CACHE_GRACE
+# секунд отдаем устаревший и обновляем в фоне
+FILES_CACHE_TTL = int(os.getenv("FILES_CACHE_TTL", 300))
+FILES_CACHE_GRACE = int(os.getenv("FILES_CACHE_GRACE", 3600))
+ROOT_FOLDER_CACHE_TTL = int(os.getenv("ROOT_FOLDER_CACHE_TTL", 3600))
+ROOT_FOLDER_NAME = "Baggins Coffee"
+# Какие общие диски обходит /files: "all" - все доступные аккаунту, "" - ни одного,
+# иначе id через запятую. Каждый диск обходится своим потоком, одновременно - не больше SHARED_DRIVE_CRAWLERS
+SHARED_DRIVES = os.getenv("SHARED_DRIVES", "all")
+SHARED_DRIVE_CRAWLERS = int(os.getenv("SHARED_DRIVE_CRAWLERS", 4))
+SHARED_DRIVES_CACHE_TTL = int(os.getenv("SHARED_DRIVES_CACHE_TTL", 600))
+
+# Сколько условий appProperties объединяется через or в одном запросе
+COPY_CHECK_BATCH = 20
+
+files_cache = StaleWhileRevalidateCache("files", FILES_CACHE_TTL, FILES_CACHE_GRACE, flights=flights)
+
+# Тяжелые маршруты: лишние запросы ждут в очереди, при переполнении - 503 с Retry-After.
+# Лимит только на саму работу: попадания в кэш /files отдаются сразу, а одинаковые
+# загрузки и копирования объединяются и занимают один слот
+files_admission = AdmissionLimit("files", limit=4, queue_size=32, timeout=30, retry_after=5)
+copy_files_admission = AdmissionLimit("copy-files", limit=2, queue_size=8, timeout=60, retry_after=30)
+
+router = APIRouter()
 
 # Настройки OAuth 2.0
-CLIENT_SECRETS_FILE = "/root/project/client_secrets.json"  # путь к вашему клиентскому секрету OAuth 2.0
+CLIENT_SECRETS_FILE = os.getenv("CLIENT_SECRETS_FILE", "/root/project/client_secrets.json")  # путь к вашему клиентскому секрету OAuth 2.0
 SCOPES = ['https://www.googleapis.com/auth/drive.metadata.readonly', 
     'https://www.googleapis.com/auth/gmail.readonly',
     'https://www.googleapis.com/auth/gmail.modify' ]
-REDIRECT_URI = "https://testing.lazy.delivery/callback"
-
-# Инициализация потока авторизации
-flow = Flow.from_client_secrets_file(
-    CLIENT_SECRETS_FILE,
-    scopes=SCOPES,
-    redirect_uri=REDIRECT_URI
-)
+REDIRECT_URI = os.getenv("OAUTH_REDIRECT_URI", "https://testing.lazy.delivery/callback")
 
 # Путь для хранения зашифрованных учетных данных
-CREDENTIALS_FILE = '/root/project/credentials.json'
+CREDENTIALS_FILE = os.getenv("CREDENTIALS_FILE", '/root/project/credentials.json')
+
+# Где хранятся аккаунты Google: "file" - один аккаунт в CREDENTIALS_FILE,
+# "db" - таблица accounts в Postgres (пока она пуста, используется CREDENTIALS_FILE)
+ACCOUNTS_STORE = os.getenv("ACCOUNTS_STORE", "file")
+# Сколько обходов, копирований и проверок почты одного аккаунта идут одновременно (у каждого вида
+# свой бюджет); короткие запросы (/file-hierarchy, /get-email-id) не ждут за ними - у них свой, больший
+ACCOUNT_CONCURRENCY = int(os.getenv("ACCOUNT_CONCURRENCY", 2))
+ACCOUNT_LOOKUP_CONCURRENCY = int(os.getenv("ACCOUNT_LOOKUP_CONCURRENCY", 8))
+# Аккаунт из CREDENTIALS_FILE: его адрес в файле не хранится
+LEGACY_ACCOUNT = "default"
+
+def create_oauth_flow():
+    """Поток авторизации создается при старте приложения; без файла секретов
+    приложение работает, но /authorize и /callback отвечают 503."""
+    from google_auth_oauthlib.flow import Flow
+
+    try:
+        return Flow.from_client_secrets_file(
+            CLIENT_SECRETS_FILE,
+            scopes=SCOPES,
+            redirect_uri=REDIRECT_URI
+        )
+    except (OSError, ValueError) as e:
+        logger.error(f"OAuth flow is not configured, {CLIENT_SECRETS_FILE}: {e}")
+        return None
+
+def get_oauth_flow(request: Request):
+    flow = request.app.state.oauth_flow
+    if flow is None:
+        raise HTTPException(status_code=503, detail="OAuth is not configured")
+    return flow
+
+def build_service(service_name, version, credentials):
+    from app.google_api import build_service
+
+    return build_service(service_name, version, credentials)
+
+def raise_if_rate_limited(error):
+    from app.google_api import raise_if_rate_limited
+
+    raise_if_rate_limited(error)
 
 def encrypt_data(data):
     return fernet.encrypt(json.dumps(data).encode()).decode()
@@ -78,24 +136,20 @@ def encrypt_data(data):
 def decrypt_data(data):
     return json.loads(fernet.decrypt(data.encode()).decode())
 
-def save_credentials(credentials):
-    encrypted_credentials = encrypt_data({
+def serialize_credentials(credentials):
+    return encrypt_data({
         'token': credentials.token,
         'refresh_token': credentials.refresh_token,
         'token_uri': credentials.token_uri,
         'client_id': credentials.client_id,
         'client_secret': credentials.client_secret,
-        'scopes': credentials.scopes
+        'scopes': credentials.scopes,
+        # Срок действия нужен, чтобы обновлять токен заранее и один раз на все воркеры
+        'expiry': credentials.expiry.isoformat() if credentials.expiry else None
     })
-    with open(CREDENTIALS_FILE, 'w') as file:
-        file.write(encrypted_credentials)
 
-def load_credentials():
-    if not os.path.exists(CREDENTIALS_FILE):
-        return None
-
-    with open(CREDENTIALS_FILE, 'r') as file:
-        encrypted_credentials = file.read()
+def deserialize_credentials(encrypted_credentials):
+    from google.oauth2.credentials import Credentials
 
     data = decrypt_data(encrypted_credentials)
     return Credentials(
@@ -104,183 +158,451 @@ def load_credentials():
         token_uri=data['token_uri'],
         client_id=data['client_id'],
         client_secret=data['client_secret'],
-        scopes=data['scopes']
+        scopes=data['scopes'],
+        expiry=datetime.fromisoformat(data['expiry']) if data.get('expiry') else None
     )
 
-def list_all_files(service, folder_id):
-    query = f"'{folder_id}' in parents and trashed = false"
-    results = service.files().list(
-        q=query,
-        pageSize=1000,
-        fields="nextPageToken, files(id, name, mimeType, parents, owners, createdTime)"
-    ).execute()
-    items = results.get('files', [])
-    while 'nextPageToken' in results:
-        page_token = results['nextPageToken']
-        results = service.files().list(
-            q=query,
-            pageSize=1000,
-            fields="nextPageToken, files(id, name, mimeType, parents, owners, createdTime)",
-            pageToken=page_token
-        ).execute()
-        items.extend(results.get('files', []))
+credentials_file = CredentialsFile(CREDENTIALS_FILE, serialize_credentials, deserialize_credentials)
 
-    all_files = []
-    for item in items:
-        all_files.append(item)
-        if item['mimeType'] == 'application/vnd.google-apps.folder':
-            all_files.extend(list_all_files(service, item['id']))
-
-    return all_files
+def save_credentials(credentials):
+    credentials_file.save(credentials)
 
-@app.get("/authorize")
-async def authorize():
-    authorization_url, _ = flow.authorization_url(prompt='consent')
+def load_credentials():
+    # Истекший токен обновляется здесь же, поэтому вызывать не из event loop
+    return credentials_file.load()
+
+async def refresh_account(email, credentials):
+    """Обновляет токен аккаунта из базы под блокировкой строки: один раз на все воркеры."""
+    from app.accounts.dao import AccountsDAO
+
+    async def update(encrypted_credentials):
+        current = deserialize_credentials(encrypted_credentials)
+        if not needs_refresh(current):
+            CREDENTIALS_REFRESHES.labels(store="db", outcome="reloaded").inc()
+            return encrypted_credentials
+        try:
+            await asyncio.to_thread(refresh_credentials, current)
+        except Exception:
+            CREDENTIALS_REFRESHES.labels(store="db", outcome="failure").inc()
+            raise
+        CREDENTIALS_REFRESHES.labels(store="db", outcome="refreshed").inc()
+        return serialize_credentials(current)
+
+    return deserialize_credentials(await AccountsDAO.update_locked(email, update))
+
+# Расшифрованные учетные данные аккаунтов из базы: email -> (зашифрованная строка, Credentials).
+# Запись сбрасывается, когда строка в базе меняется (обновление токена, повторная
+# авторизация), - как перечитывание CredentialsFile по сигнатуре файла
+_decrypted_accounts = {}
+
+def decrypt_account(account):
+    cached = _decrypted_accounts.get(account.email)
+    if cached is None or cached[0] != account.credentials:
+        cached = (account.credentials, deserialize_credentials(account.credentials))
+        _decrypted_accounts[account.email] = cached
+    return account.email, cached[1]
+
+async def refresh_if_needed(email, credentials):
+    if not needs_refresh(credentials):
+        return email, credentials
+    try:
+        return email, await refresh_account(email, credentials)
+    except Exception as e:
+        logger.error(f"Failed to refresh token of {email}: {e}")
+        return email, credentials
+
+async def load_accounts():
+    """Список (аккаунт, учетные данные) с действительными учетными данными."""
+    accounts = []
+    if ACCOUNTS_STORE == "db":
+        # app.database требует настроек Postgres, поэтому импорт только в режиме db
+        from app.accounts.dao import AccountsDAO
+
+        stored = await AccountsDAO.find_all()
+        for email in _decrypted_accounts.keys() - {account.email for account in stored}:
+            del _decrypted_accounts[email]
+        # Истекшие токены разных аккаунтов обновляются одновременно
+        accounts = await asyncio.gather(*(refresh_if_needed(*decrypt_account(account)) for account in stored))
+    if not accounts:
+        # Файл перечитывается и расшифровывается только при смене его сигнатуры
+        credentials = await asyncio.to_thread(load_credentials)
+        if credentials:
+            accounts = [(LEGACY_ACCOUNT, credentials)]
+    return [(email, credentials) for email, credentials in accounts if credentials.valid]
+
+async def get_accounts(account=None):
+    """Аккаунты для запроса: указанный в параметре account или все."""
+    accounts = await load_accounts()
+    if account:
+        accounts = [item for item in accounts if item[0] == account.strip().lower()]
+    if not accounts:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return accounts
+
+async def register_account(credentials):
+    """Сохраняет учетные данные после авторизации и возвращает адрес аккаунта."""
+    if ACCOUNTS_STORE != "db":
+        await asyncio.to_thread(save_credentials, credentials)
+        return LEGACY_ACCOUNT
+
+    from app.accounts.dao import AccountsDAO
+
+    email = await asyncio.to_thread(fetch_account_email, credentials)
+    await AccountsDAO.save(email, serialize_credentials(credentials))
+    return email
+
+def fetch_account_email(credentials):
+    service = build_service('gmail', 'v1', credentials)
+    return service.users().getProfile(userId='me').execute()['emailAddress'].lower()
+
+# Лимиты аккаунтов: Google ограничивает частоту запросов на пользователя, поэтому
+# один большой аккаунт не должен занимать все потоки. Слот ждется в event loop,
+# а не в потоке пула
+CRAWL, COPY, MAIL, LOOKUP = "crawl", "copy", "mail", "lookup"
+_account_slots = {}
+
+def account_slot(account, kind):
+    if (account, kind) not in _account_slots:
+        limit = ACCOUNT_LOOKUP_CONCURRENCY if kind == LOOKUP else ACCOUNT_CONCURRENCY
+        _account_slots[account, kind] = asyncio.Semaphore(limit)
+    return _account_slots[account, kind]
+
+async def run_for_account(account, kind, func, *args):
+    """Выполняет блокирующую func в потоке, не больше бюджета вида kind на аккаунт."""
+    async with account_slot(account, kind):
+        return await asyncio.to_thread(func, *args)
+
+def successful_results(accounts, results):
+    """Результаты успешных аккаунтов; если упали все - исключение первого."""
+    succeeded = []
+    for (email, _), result in zip(accounts, results):
+        if isinstance(result, Exception):
+            logger.error(f"Account {email} failed: {result}")
+        else:
+            succeeded.append((email, result))
+    if not succeeded:
+        raise results[0]
+    return succeeded
+
+def list_all_files(service, folder_id, checkpoint=None, drive_id=None):
+    """Все файлы и папки под folder_id. С именем checkpoint обход, упавший
+    на середине, при следующем вызове продолжается с последнего чекпоинта."""
+    crawl = FolderCrawl(
+        service, folder_id, "nextPageToken, files(id, name, mimeType, parents, owners, createdTime, driveId)",
+        checkpoint=checkpoint, drive_id=drive_id,
+    )
+    return crawl.run()
+
+def crawl_drive(credentials, folder_id, checkpoint=None, drive_id=None):
+    # Диски обходятся в разных потоках, а httplib2 не потокобезопасен: у каждого свой сервис
+    service = build_service('drive', 'v3', credentials)
+    return list_all_files(service, folder_id, checkpoint=checkpoint, drive_id=drive_id)
+
+@router.get("/authorize")
+async def authorize(request: Request):
+    flow = get_oauth_flow(request)
+    # select_account: дополнительные аккаунты подключаются повторной авторизацией
+    authorization_url, _ = flow.authorization_url(prompt='consent select_account')
     return RedirectResponse(authorization_url)
 
-@app.get("/callback")
+@router.get("/callback")
 async def oauth2_callback(request: Request):
+    flow = get_oauth_flow(request)
     code = request.query_params.get('code')
     try:
         flow.fetch_token(code=code)
         credentials = flow.credentials
-        save_credentials(credentials)
-        return JSONResponse({"message": "Authorization successful."})
+        account = await register_account(credentials)
+        return JSONResponse({"message": "Authorization successful.", "account": account})
     except Exception as e:
         logger.error(f"Error during OAuth callback: {e}")
         raise HTTPException(status_code=400, detail="Authorization failed")
 
-@app.get("/files")
-async def list_files():
-    credentials = load_credentials()
-    if not credentials or not credentials.valid:
-        raise HTTPException(status_code=401, detail="Unauthorized")
-
+# id корневой папки почти не меняется, поэтому не ищем ее по имени при каждом обходе;
+# у каждого аккаунта своя папка
+@cached(TTLCache(maxsize=256, ttl=ROOT_FOLDER_CACHE_TTL), key=lambda service, name, account=LEGACY_ACCOUNT: (account, name),
+        lock=threading.Lock())
+def find_folder_id(service, name, account=LEGACY_ACCOUNT):
+    # Папка может лежать и в общем диске
+    response = service.files().list(
+        q=f"name='{name}' and mimeType='application/vnd.google-apps.folder' and trashed=false",
+        fields="files(id, name)",
+        corpora="allDrives",
+        supportsAllDrives=True,
+        includeItemsFromAllDrives=True,
+    ).execute()
+    folders = response.get('files', [])
+    if not folders:
+        raise HTTPException(status_code=404, detail=f"{name} folder not found")
+    return folders[0]['id']
+
+@cached(TTLCache(maxsize=256, ttl=SHARED_DRIVES_CACHE_TTL), key=lambda service, account=LEGACY_ACCOUNT: account,
+        lock=threading.Lock())
+def find_shared_drives(service, account=LEGACY_ACCOUNT):
+    """id общих дисков, которые обходит /files (см. SHARED_DRIVES)."""
+    if SHARED_DRIVES != "all":
+        return [drive_id.strip() for drive_id in SHARED_DRIVES.split(",") if drive_id.strip()]
+    drive_ids = []
+    page_token = None
+    while True:
+        results = service.drives().list(pageSize=100, fields="nextPageToken, drives(id)", pageToken=page_token).execute()
+        drive_ids.extend(drive['id'] for drive in results.get('drives', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return drive_ids
+
+def find_files(credentials, older_than_minutes=20, exclude_owner='kolomojcysuai@gmail.com', account=LEGACY_ACCOUNT):
+    service = build_service('drive', 'v3', credentials)
     try:
-        service = build('drive', 'v3', credentials=credentials)
-        # Ищем начальную папку
-        response = service.files().list(
-            q="name='Baggins Coffee' and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            fields="files(id, name)"
-        ).execute()
-        root_folder = response.get('files', [])
-        if not root_folder:
-            raise HTTPException(status_code=404, detail="Baggins Coffee folder not found")
-        
-        root_folder_id = root_folder[0]['id']
-        all_files = list_all_files(service, root_folder_id)
-
-        if not all_files:
-            return {"files": []}
-
-        one_hour_ago = datetime.utcnow() - timedelta(minutes=20)
-        kolomojcysuai_email = 'kolomojcysuai@gmail.com'
-        
-        files = []
-        for item in all_files:
-            created_time = datetime.strptime(item['createdTime'], "%Y-%m-%dT%H:%M:%S.%fZ")
-            if created_time < one_hour_ago:
-                owner_emails = [owner['emailAddress'] for owner in item.get('owners', [])]
-                if kolomojcysuai_email not in owner_emails:
-                    files.append({
-                        "id": item["id"],
-                        "name": item["name"],
-                        "createdTime": item["createdTime"],
-                        "owners": owner_emails
-                    })
-
-        return {"files": files}
+        drive_ids = find_shared_drives(service, account)
     except Exception as e:
+        # Например, токену не хватает scope для drives.list: обходим только "Мой диск"
+        logger.warning(f"Failed to list shared drives of {account}, crawling My Drive only: {e}")
+        drive_ids = []
+    # Ищем начальную папку; если ее нет, но есть общие диски, обходим только их
+    try:
+        root_folder_id = find_folder_id(service, ROOT_FOLDER_NAME, account)
+    except HTTPException:
+        if not drive_ids:
+            raise
+        root_folder_id = None
+
+    # Аргументы list_all_files для каждого обхода; корень общего диска - папка с id диска.
+    # В имени чекпоинта - хэш параметров запроса: промахи с разными фильтрами идут
+    # одновременно и не должны продолжать или перезаписывать чужой обход
+    query = hashlib.sha1(f"{older_than_minutes}:{exclude_owner}".encode()).hexdigest()[:12]
+    crawls = [{"folder_id": root_folder_id, "checkpoint": f"files-{account}-{query}"}] if root_folder_id else []
+    crawls += [
+        {"folder_id": drive_id, "checkpoint": f"files-{account}-{drive_id}-{query}", "drive_id": drive_id}
+        for drive_id in drive_ids
+    ]
+    with track_memory("files_crawl"):
+        if len(crawls) == 1:
+            results = [list_all_files(service, **crawls[0])]
+        else:
+            with ThreadPoolExecutor(min(SHARED_DRIVE_CRAWLERS, len(crawls)), thread_name_prefix="drive-crawl") as executor:
+                results = list(executor.map(lambda crawl: crawl_drive(credentials, **crawl), crawls))
+        # Корневая папка может лежать в одном из общих дисков: ее файлы берем один раз
+        unique = {}
+        for items in results:
+            for item in items:
+                unique.setdefault(item['id'], item)
+        all_files = list(unique.values())
+
+    if not all_files:
+        return {"files": []}
+
+    created_before = datetime.utcnow() - timedelta(minutes=older_than_minutes)
+
+    files = []
+    for item in all_files:
+        created_time = datetime.strptime(item['createdTime'], "%Y-%m-%dT%H:%M:%S.%fZ")
+        if created_time < created_before:
+            owner_emails = [owner['emailAddress'] for owner in item.get('owners', [])]
+            if exclude_owner.lower() not in [owner.lower() for owner in owner_emails]:
+                files.append({
+                    "id": item["id"],
+                    "name": item["name"],
+                    "createdTime": item["createdTime"],
+                    "owners": owner_emails,
+                    "account": account,
+                    "driveId": item.get("driveId")
+                })
+
+    return {"files": files}
+
+async def load_files(email, credentials, older_than_minutes, exclude_owner):
+    async with files_admission.slot():
+        return await run_for_account(email, CRAWL, find_files, credentials, older_than_minutes, exclude_owner, email)
+
+@router.get("/files")
+async def list_files(older_than_minutes: int = 20, exclude_owner: str = 'kolomojcysuai@gmail.com',
+                     account: str | None = None):
+    accounts = await get_accounts(account)
+
+    exclude_owner = exclude_owner.strip().lower()
+    try:
+        # Обход дерева блокирующий (httplib2, ожидание лимитера), поэтому в отдельном потоке;
+        # аккаунты обходятся параллельно, у каждого своя запись в кэше
+        results = await asyncio.gather(*(
+            files_cache.get(
+                ("files", email, older_than_minutes, exclude_owner),
+                load_files, email, credentials, older_than_minutes, exclude_owner,
+            )
+            for email, credentials in accounts
+        ), return_exceptions=True)
+        succeeded = successful_results(accounts, results)
+        files = [file for _, (result, _, _) in succeeded for file in result["files"]]
+        statuses = {status for _, (_, status, _) in succeeded}
+        status = MISS if MISS in statuses else STALE if STALE in statuses else HIT
+        age = max(age for _, (_, _, age) in succeeded)
+        body = {"files": files}
+        if len(succeeded) < len(accounts):
+            succeeded_accounts = {email for email, _ in succeeded}
+            body["failed_accounts"] = [email for email, _ in accounts if email not in succeeded_accounts]
+        return JSONResponse(body, headers=files_cache.headers(status, age))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise_if_rate_limited(e)
         logger.error(f"Error fetching files: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch files")
 
-@app.get("/file-hierarchy/{file_id}")
-async def get_file_hierarchy_route(file_id: str):
-    credentials = load_credentials()
-    if not credentials or not credentials.valid:
-        raise HTTPException(status_code=401, detail="Unauthorized")
+@router.get("/file-hierarchy/{file_id}")
+async def get_file_hierarchy_route(file_id: str, account: str | None = None):
+    # Без account файл ищется в первом аккаунте
+    email, credentials = (await get_accounts(account))[0]
 
     try:
-        service = build('drive', 'v3', credentials=credentials)
-        hierarchy = get_file_hierarchy(service, file_id)
+        hierarchy = await flights.do(
+            ("file-hierarchy", email, file_id.strip()),
+            run_for_account, email, LOOKUP, fetch_file_hierarchy, credentials, file_id.strip(),
+        )
         return {"hierarchy": hierarchy}
     except Exception as e:
+        raise_if_rate_limited(e)
         logger.error(f"Error fetching file hierarchy: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch file hierarchy")
 
+def fetch_file_hierarchy(credentials, file_id):
+    service = build_service('drive', 'v3', credentials)
+    return get_file_hierarchy(service, file_id)
+
 def get_file_hierarchy(service, file_id):
     """Возвращает иерархию папок для указанного файла."""
     hierarchy = []
     current_id = file_id
     while current_id:
-        file = service.files().get(fileId=current_id, fields="id, name, parents").execute()
+        file = service.files().get(fileId=current_id, fields="id, name, parents", supportsAllDrives=True).execute()
         hierarchy.insert(0, {"id": file["id"], "name": file["name"]})
         parents = file.get("parents")
         current_id = parents[0] if parents else None
     return hierarchy
 
-@app.post("/copy-files/{email}")
-async def copy_files(email: str):
-    credentials = load_credentials()
-    if not credentials or not credentials.valid:
-        raise HTTPException(status_code=401, detail="Unauthorized")
+def list_query(service, query, fields):
+    """Все страницы files().list по запросу."""
+    items = []
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=query, fields=f"nextPageToken, {fields}", pageToken=page_token,
+            supportsAllDrives=True, includeItemsFromAllDrives=True,
+        ).execute()
+        items.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return items
+
+def find_existing_copies(service, source_ids):
+    """Пары (id исходного файла, папка) для уже сделанных копий."""
+    existing = set()
+    # Условия объединяются через or пачками: длина q ограничена длиной URL
+    for i in range(0, len(source_ids), COPY_CHECK_BATCH):
+        conditions = " or ".join(
+            f"appProperties has {{ key='{COPY_SOURCE_PROPERTY}' and value='{source_id}' }}"
+            for source_id in source_ids[i:i + COPY_CHECK_BATCH]
+        )
+        for copy in list_query(service, f"({conditions}) and trashed = false", "files(id, parents, appProperties)"):
+            source_id = copy.get('appProperties', {}).get(COPY_SOURCE_PROPERTY)
+            for parent_id in copy.get('parents', []):
+                existing.add((source_id, parent_id))
+    return existing
+
+def copy_owner_files(credentials, email):
+    service = build_service('drive', 'v3', credentials)
+
+    # Ищем все файлы, владельцем которых является email; сделанные нами копии не копируем
+    query = f"'{email}' in owners and trashed = false"
+    files_to_copy = [
+        file for file in list_query(service, query, "files(id, name, mimeType, parents, appProperties)")
+        if file.get('parents') and COPY_SOURCE_PROPERTY not in file.get('appProperties', {})
+    ]
+    existing = find_existing_copies(service, [file['id'] for file in files_to_copy])
+
+    created = skipped = 0
+    for file in files_to_copy:
+        # Получаем родительскую папку
+        parent_ids = file['parents']
+        if (file['id'], parent_ids[0]) in existing:
+            skipped += 1
+            continue
+
+        copy_metadata = {
+            'name': file['name'],
+            'parents': parent_ids,
+            'appProperties': {COPY_SOURCE_PROPERTY: file['id']}
+        }
+        service.files().copy(fileId=file['id'], body=copy_metadata, supportsAllDrives=True).execute()
+        created += 1
+
+    logger.info(f"Copied files of {email}: {created} created, {skipped} already copied")
+    return {"created": created, "skipped": skipped}
+
+async def copy_owner_files_once(accounts, email):
+    # Слот занимает только ведущий вызов single-flight: присоединившиеся ждут его результат без слота
+    async with copy_files_admission.slot():
+        created = skipped = 0
+        # Аккаунты по очереди: следующий находит копии, сделанные предыдущим, и не дублирует их
+        for account_email, credentials in accounts:
+            result = await run_for_account(account_email, COPY, copy_owner_files, credentials, email)
+            created += result["created"]
+            skipped += result["skipped"]
+        return {"created": created, "skipped": skipped}
+
+@router.post("/copy-files/{email}")
+async def copy_files(email: str, account: str | None = None):
+    accounts = await get_accounts(account)
+    email = email.strip().lower()
 
     try:
-        service = build('drive', 'v3', credentials=credentials)
-
-        # Ищем все файлы, владельцем которых является email
-        query = f"'{email}' in owners and trashed = false"
-        response = service.files().list(q=query, fields="files(id, name, mimeType, parents)").execute()
-        files_to_copy = response.get('files', [])
-
-        for file in files_to_copy:
-            # Получаем родительскую папку
-            parent_ids = file.get('parents', [])
-            if not parent_ids:
-                continue
-            
-            copy_metadata = {
-                'name': file['name'],
-                'parents': parent_ids
-            }
-            service.files().copy(fileId=file['id'], body=copy_metadata).execute()
-
-        return JSONResponse({"message": "Files copied successfully"})
+        # Одновременные копирования одного владельца объединяются (по владельцу, а не по аккаунту):
+        # иначе они не видят копий друг друга и создают дубликаты. Присоединившийся вызов
+        # получает результат ведущего, даже если просил другой аккаунт
+        result = await flights.do(("copy-files", email), copy_owner_files_once, accounts, email)
+        return JSONResponse({"message": "Files copied successfully", **result})
+    except HTTPException:
+        raise
     except Exception as e:
+        raise_if_rate_limited(e)
         logger.error(f"Error copying files: {e}")
         raise HTTPException(status_code=500, detail="Failed to copy files")
-    
 
-@app.middleware("http")
-async def prometheus_middleware(request: Request, call_next):
-    method = request.method
-    endpoint = request.url.path
-
-    REQUEST_COUNT.labels(method=method, endpoint=endpoint).inc()
-    start_time = time.time()
-    
-    response = await call_next(request)
+@router.post("/copy-subtree/{folder_id}", status_code=202)
+async def copy_subtree(folder_id: str, target_folder_id: str | None = None, name: str | None = None,
+                       account: str | None = None):
+    """Запускает копию папки со всем содержимым; без target_folder_id - рядом с исходной."""
+    email, credentials = (await get_accounts(account))[0]
+    job = SubtreeCopyJob(lambda: build_service('drive', 'v3', credentials), folder_id.strip(), target_folder_id, name)
+    # Копия идет минуты, поэтому не в BackgroundTasks (те держат запрос открытым для метрик) и не
+    # в общем пуле to_thread: там она заняла бы потоки остальных маршрутов. Слот аккаунта она
+    # тоже не занимает: у задачи свой пул потоков (SUBTREE_COPY_WORKERS)
+    if not submit_job(job):
+        ADMISSION_REJECTED.labels(route="copy-subtree", reason="jobs_full").inc()
+        raise HTTPException(
+            status_code=503,
+            detail=f"{SUBTREE_COPY_MAX_JOBS} subtree copies are already running, retry later",
+            headers={"Retry-After": "60"},
+        )
+    return {"job_id": job.id, "status_url": f"/copy-subtree/jobs/{job.id}"}
+
+@router.get("/copy-subtree/jobs/{job_id}")
+async def copy_subtree_progress(job_id: str, id_map: bool = False):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.progress(include_id_map=id_map)
     
-    latency = time.time() - start_time
-    REQUEST_LATENCY.labels(method=method, endpoint=endpoint).observe(latency)
-    
-    return response
-
-@app.get("/metrics")
-async def metrics():
-    return Response(generate_latest(REGISTRY), media_type="text/plain")
 
 
 # Новый роутер для выполнения задачи с использованием imaplib и selenium
-@app.post("/check-emails/")
+@router.post("/check-emails/")
 async def check_emails(background_tasks: BackgroundTasks):
     background_tasks.add_task(check_and_process_emails)
     return {"message": "Started checking emails"}
 
 # Подключение к почтовому ящику
-def connect_to_mail():
-    creds = load_credentials()
-    service = build('gmail', 'v1', credentials=creds, cache_discovery=False)
+def connect_to_mail(credentials):
+    service = build_service('gmail', 'v1', credentials)
     return service
 
 # Получение новых писем
@@ -289,10 +611,20 @@ def get_unread_emails(service):
     messages = results.get('messages', [])
     return messages
 
-# Проверка и обработка новых писем
-def check_and_process_emails():
+# Проверка и обработка новых писем во всех аккаунтах параллельно
+async def check_and_process_emails():
     try:
-        service = connect_to_mail()
+        accounts = await load_accounts()
+    except Exception as e:
+        logger.error(f"Failed to load accounts: {e}")
+        return
+    await asyncio.gather(*(
+        run_for_account(email, MAIL, process_account_emails, email, credentials) for email, credentials in accounts
+    ))
+
+def process_account_emails(account, credentials):
+    try:
+        service = connect_to_mail(credentials)
         email_ids = get_unread_emails(service)
         for e_id in email_ids:
             msg = service.users().messages().get(userId='me', id=e_id['id']).execute()
@@ -304,120 +636,164 @@ def check_and_process_emails():
                     break
 
             if email_from and "drive-shares-dm-noreply@google.com" in email_from:
+                # Приглашение принимается в браузере под GMAIL_USERNAME, письма
+                # других аккаунтов оставляем непрочитанными
+                if not can_accept_invitations(account):
+                    logger.warning(f"Skipping invitation {e_id['id']} of {account}: browser logs in as GMAIL_USERNAME")
+                    continue
+
                 # Инициализация Selenium для автоматического нажатия "Accept"
                 accept_invitation(e_id['id'])
 
                 # Пометить письмо как прочитанное
                 service.users().messages().modify(userId='me', id=e_id['id'], body={'removeLabelIds': ['UNREAD']}).execute()
     except Exception as e:
-        logger.error(f"An error occurred: {e}")
+        logger.error(f"An error occurred in {account}: {e}")
+
+def can_accept_invitations(account):
+    return account == LEGACY_ACCOUNT or account == (os.getenv("GMAIL_USERNAME") or "").lower()
 
 def accept_invitation(email_id):
-    service = Service(ChromeDriverManager().install())
-    options = webdriver.ChromeOptions()
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--headless")  # Запуск в фоновом режиме
-    driver = webdriver.Chrome(service=service, options=options)
-    logger.info("Chrome driver initialized.")
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.common.action_chains import ActionChains
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    from app.browser import create_driver, open_page, quit_driver, step
+
+    driver = create_driver("accept_invitation", headless=True)
 
     try:
         # Открытие Gmail
-        driver.get("https://mail.google.com/")
+        open_page(driver, "https://mail.google.com/", "open_gmail")
         wait = WebDriverWait(driver, 30)
 
         # Вход в Google аккаунт
-        email_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='email']")))
-        email_input.send_keys(os.getenv("GMAIL_USERNAME"))
-        email_input.send_keys(Keys.RETURN)
+        with step(driver, "enter_email"):
+            email_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='email']")))
+            email_input.send_keys(os.getenv("GMAIL_USERNAME"))
+            email_input.send_keys(Keys.RETURN)
         time.sleep(2)
 
-        password_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='password']")))
-        password_input.send_keys(os.getenv("GMAIL_PASSWORD"))
-        password_input.send_keys(Keys.RETURN)
+        with step(driver, "enter_password"):
+            password_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='password']")))
+            password_input.send_keys(os.getenv("GMAIL_PASSWORD"))
+            password_input.send_keys(Keys.RETURN)
         time.sleep(5)
 
         # Ожидание загрузки инбокса
-        wait.until(EC.presence_of_element_located((By.XPATH, "//div[@role='main']")))
+        with step(driver, "wait_inbox"):
+            wait.until(EC.presence_of_element_located((By.XPATH, "//div[@role='main']")))
 
         # Открытие письма по ID
         email_url = f"https://mail.google.com/mail/u/0/#inbox/{email_id}"
-        driver.get(email_url)
+        open_page(driver, email_url, "open_email")
         logger.info(f"Opened the email with ID {email_id}")
         time.sleep(2)
 
         # Нахождение и нажатие кнопки "In new window" с использованием полного XPATH
-        new_window_button = wait.until(EC.element_to_be_clickable((By.XPATH, '/html/body/div[7]/div[3]/div/div[2]/div[2]/div/div/div/div[2]/div/div[1]/div/div[2]/div/div[2]/div[1]/div/div[1]/div/span[4]/button/div')))
-        new_window_button.click()
+        with step(driver, "click_new_window"):
+            new_window_button = wait.until(EC.element_to_be_clickable((By.XPATH, '/html/body/div[7]/div[3]/div/div[2]/div[2]/div/div/div/div[2]/div/div[1]/div/div[2]/div/div[2]/div[1]/div/div[1]/div/span[4]/button/div')))
+            new_window_button.click()
         time.sleep(1)  # Ожидание после нажатия
         logger.info("Clicked the 'In new window' button.")
 
         # Переключение на новую вкладку
-        wait.until(EC.number_of_windows_to_be(2))  # Ожидание открытия второй вкладки
-        driver.switch_to.window(driver.window_handles[-1])  # Переключение на последнюю открытую вкладку
+        with step(driver, "switch_to_email_tab"):
+            wait.until(EC.number_of_windows_to_be(2))  # Ожидание открытия второй вкладки
+            driver.switch_to.window(driver.window_handles[-1])  # Переключение на последнюю открытую вкладку
         logger.info("Switched to new tab.")
         logger.info(f"2 window handles before switch: {driver.window_handles}")
         time.sleep(2)
 
         # Нахождение и нажатие кнопки "Responde" с использованием полного XPATH
-        respond_button = wait.until(EC.element_to_be_clickable((By.XPATH, '/html/body/div[4]/div[2]/div/div[3]/div/div[2]/div[2]/div[1]/div/div[2]/div/div[3]/div[2]/div/div[3]/div/div/div/div/div/div[1]/div[2]/div[3]/div[3]/div[1]/div/table/tbody/tr/td/table/tbody/tr/td/table[1]/tbody/tr/td/div[2]/a')))
-        respond_button.click()
+        with step(driver, "click_respond"):
+            respond_button = wait.until(EC.element_to_be_clickable((By.XPATH, '/html/body/div[4]/div[2]/div/div[3]/div/div[2]/div[2]/div[1]/div/div[2]/div/div[3]/div[2]/div/div[3]/div/div/div/div/div/div[1]/div[2]/div[3]/div[3]/div[1]/div/table/tbody/tr/td/table/tbody/tr/td/table[1]/tbody/tr/td/div[2]/a')))
+            respond_button.click()
         logger.info("Clicked the 'Responde' button.")
         time.sleep(10)
 
         # Ожидание открытия новой вкладки и переключение на неё
-        wait.until(EC.number_of_windows_to_be(3))  # Ожидание открытия новой вкладки
-        logger.info(f"All window handles before switch: {driver.window_handles}")
-        driver.switch_to.window(driver.window_handles[-1])  # Переключение на последнюю открытую вкладку
+        with step(driver, "switch_to_invitation_tab"):
+            wait.until(EC.number_of_windows_to_be(3))  # Ожидание открытия новой вкладки
+            logger.info(f"All window handles before switch: {driver.window_handles}")
+            driver.switch_to.window(driver.window_handles[-1])  # Переключение на последнюю открытую вкладку
         logger.info(f"Current window handle after switch: {driver.current_window_handle}")
         time.sleep(5)
 
 
-        actions = ActionChains(driver)
-        actions.send_keys(Keys.RETURN).perform()
+        with step(driver, "confirm"):
+            actions = ActionChains(driver)
+            actions.send_keys(Keys.RETURN).perform()
         print("Pressed the 'Enter' key.")
 
     except Exception as e:
         logger.error(f"An error occurred while accepting the invitation: {e}")
     finally:
-        driver.quit()
-        logger.info("Chrome driver quit.")
+        quit_driver(driver)
 
 
 
 
 
 # Новый роутер для получения ID письма
-@app.get("/get-email-id/")
-async def get_email_id():
+def find_share_email_id(credentials):
+    service = connect_to_mail(credentials)
+    email_ids = get_unread_emails(service)
+    for e_id in email_ids:
+        msg = service.users().messages().get(userId='me', id=e_id['id']).execute()
+        email_from = None
+        headers = msg.get('payload', {}).get('headers', [])
+        for header in headers:
+            if header['name'] == 'From':
+                email_from = header['value']
+                break
+
+        if email_from and "drive-shares-dm-noreply@google.com" in email_from:
+            return {"email_id": e_id['id']}
+
+    return {"message": "No unread emails from drive-shares-dm-noreply@google.com found"}
+
+@router.get("/get-email-id/")
+async def get_email_id(account: str | None = None):
+    email, credentials = (await get_accounts(account))[0]
     try:
-        service = connect_to_mail()
-        email_ids = get_unread_emails(service)
-        for e_id in email_ids:
-            msg = service.users().messages().get(userId='me', id=e_id['id']).execute()
-            email_from = None
-            headers = msg.get('payload', {}).get('headers', [])
-            for header in headers:
-                if header['name'] == 'From':
-                    email_from = header['value']
-                    break
-
-            if email_from and "drive-shares-dm-noreply@google.com" in email_from:
-                return {"email_id": e_id['id']}
-
-        return {"message": "No unread emails from drive-shares-dm-noreply@google.com found"}
+        return await flights.do(("get-email-id", email), run_for_account, email, LOOKUP, find_share_email_id, credentials)
     except Exception as e:
+        raise_if_rate_limited(e)
         logger.error(f"An error occurred while fetching email ID: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch email ID")
 
-# Инициализация планировщика
-scheduler = AsyncIOScheduler()
-
-# Добавление задачи в планировщик
-@scheduler.scheduled_job('interval', minutes=1)
-def scheduled_job():
-    check_and_process_emails()
-
-# Запуск планировщика при старте приложения
-@app.on_event("startup")
-async def startup_event():
-    scheduler.start()
\ No newline at end of file
+def create_scheduler():
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+    scheduler = AsyncIOScheduler()
+    # Добавление задачи в планировщик
+    scheduler.add_job(check_and_process_emails, 'interval', minutes=1)
+    return scheduler
+
+def create_app():
+    app = FastAPI()
+    setup_metrics(app)
+    app.add_middleware(GoogleApiCallsMiddleware)
+    setup_profiling(app)
+    setup_memory_tracking(app)
+    app.include_router(router)
+    app.state.oauth_flow = None
+
+    # Запуск планировщика и поток авторизации - при старте приложения, а не при импорте
+    @app.on_event("startup")
+    async def startup_event():
+        app.state.oauth_flow = create_oauth_flow()
+        app.state.scheduler = create_scheduler()
+        app.state.scheduler.start()
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        app.state.scheduler.shutdown(wait=False)
+
+    return app
+
+# uvicorn app.release:app
+app = create_app()
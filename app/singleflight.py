@@ -0,0 +1,38 @@
+import asyncio
+
+from prometheus_client import Counter
+
+SINGLEFLIGHT_CALLS = Counter(
+    'singleflight_calls_total', 'Calls to coalesced endpoints: executed or joined an in-flight run',
+    ['endpoint', 'result'],
+)
+
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые вызовы в одно выполнение.
+
+    Ключ - кортеж (эндпоинт, нормализованные параметры...). Пока вычисление
+    по ключу идет, новые вызовы ждут его результат (или исключение) вместо
+    повторного запуска. Отмена одного из ожидающих не отменяет общее вычисление.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func, *args):
+        task = self._calls.get(key)
+        if task is None:
+            SINGLEFLIGHT_CALLS.labels(endpoint=key[0], result="executed").inc()
+            task = asyncio.ensure_future(func(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            SINGLEFLIGHT_CALLS.labels(endpoint=key[0], result="coalesced").inc()
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Помечаем исключение полученным, даже если все ожидающие уже отменены
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,221 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from prometheus_client import Counter
+
+from app.crawler import FOLDER_MIME_TYPE, FolderCrawl
+
+# Параллельность копирования файлов и размер пачки, которую ждем целиком
+SUBTREE_COPY_WORKERS = int(os.getenv("SUBTREE_COPY_WORKERS", 8))
+SUBTREE_COPY_BATCH = int(os.getenv("SUBTREE_COPY_BATCH", 200))
+# Сколько задач идет одновременно: у них свой пул, общий пул asyncio.to_thread они не занимают
+SUBTREE_COPY_MAX_JOBS = int(os.getenv("SUBTREE_COPY_MAX_JOBS", 2))
+# Сколько последних задач помнить для /copy-subtree/jobs/{id}
+SUBTREE_COPY_JOBS_KEPT = 100
+ERRORS_KEPT = 20
+
+SUBTREE_COPY_ITEMS = Counter(
+    'subtree_copy_items_total', 'Folders created and files copied by subtree copies', ['kind', 'outcome']
+)
+
+# Копия помечается id исходного файла, поэтому повторный /copy-files не создает дубликаты
+COPY_SOURCE_PROPERTY = "sourceFileId"
+
+PENDING, CRAWLING, FOLDERS, FILES, DONE, FAILED = "pending", "crawling", "folders", "files", "done", "failed"
+
+
+class SubtreeCopyJob:
+    """Копия поддерева папок с сохранением структуры.
+
+    Сначала обходится исходное поддерево, затем уровень за уровнем создаются
+    папки (папки одного уровня - параллельно, их родители уже есть), потом
+    файлы копируются пачками в пуле потоков. У каждого потока свой сервис:
+    httplib2 не потокобезопасен. Соответствие старых id новым - в id_map.
+    """
+
+    def __init__(self, make_service, source_id, target_parent_id=None, name=None,
+                 workers=SUBTREE_COPY_WORKERS, batch_size=SUBTREE_COPY_BATCH):
+        self.id = uuid.uuid4().hex
+        self.make_service = make_service
+        self.source_id = source_id
+        self.target_parent_id = target_parent_id
+        self.name = name
+        self.workers = workers
+        self.batch_size = batch_size
+        self.status = PENDING
+        self.error = None
+        self.errors = []
+        self.id_map = {}
+        self.folders_total = self.folders_created = 0
+        self.files_total = self.files_copied = self.files_failed = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def service(self):
+        if not hasattr(self._local, "service"):
+            self._local.service = self.make_service()
+        return self._local.service
+
+    def run(self):
+        try:
+            with ThreadPoolExecutor(self.workers, thread_name_prefix=f"subtree-copy-{self.id[:8]}") as executor:
+                folders_by_level, files = self._crawl()
+                self.status = FOLDERS
+                for folders in folders_by_level:
+                    list(executor.map(self._create_folder, folders))
+                self.status = FILES
+                for i in range(0, len(files), self.batch_size):
+                    list(executor.map(self._copy_file, files[i:i + self.batch_size]))
+            self.status = DONE
+        except Exception as e:
+            self.status = FAILED
+            self.error = str(e)
+            logging.error(f"Subtree copy {self.id} of {self.source_id} failed: {e}")
+        finally:
+            self.finished_at = time.time()
+        logging.info(
+            f"Subtree copy {self.id} of {self.source_id} {self.status}: {self.folders_created} folders, "
+            f"{self.files_copied} files copied, {self.files_failed} failed in {self.finished_at - self.started_at:.1f}s"
+        )
+
+    def _crawl(self):
+        """Папки по уровням (корень - первый уровень) и список файлов."""
+        self.status = CRAWLING
+        service = self.service()
+        source = service.files().get(
+            fileId=self.source_id, fields="id, name, mimeType, parents, driveId", supportsAllDrives=True
+        ).execute()
+        if source['mimeType'] != FOLDER_MIME_TYPE:
+            raise ValueError(f"{self.source_id} is not a folder")
+        if self.target_parent_id is None:
+            self.target_parent_id = (source.get('parents') or ["root"])[0]
+        source['name'] = self.name or source['name']
+
+        items = FolderCrawl(
+            service, self.source_id, "nextPageToken, files(id, name, mimeType, parents)", label="subtree_copy",
+            drive_id=source.get('driveId'),
+        ).run()
+        levels = {self.source_id: 0}
+        folders_by_level = defaultdict(list)
+        folders_by_level[0].append((source, self.target_parent_id))
+        files = []
+        # Обход отдает папку раньше ее содержимого, поэтому уровень родителя уже известен
+        for item in items:
+            parent_id = next(parent for parent in item['parents'] if parent in levels)
+            if item['mimeType'] == FOLDER_MIME_TYPE:
+                if item['id'] in levels:
+                    continue
+                levels[item['id']] = levels[parent_id] + 1
+                folders_by_level[levels[item['id']]].append((item, parent_id))
+            else:
+                files.append((item, parent_id))
+        self.folders_total = len(levels)
+        self.files_total = len(files)
+        return [folders_by_level[level] for level in sorted(folders_by_level)], files
+
+    def _create_folder(self, entry):
+        folder, parent_id = entry
+        # Корень создается в target_parent_id, остальные - в уже созданной копии родителя
+        new_parent_id = self.id_map.get(parent_id, parent_id)
+        created = self.service().files().create(
+            body={
+                'name': folder['name'],
+                'mimeType': FOLDER_MIME_TYPE,
+                'parents': [new_parent_id],
+                'appProperties': {COPY_SOURCE_PROPERTY: folder['id']},
+            },
+            fields="id",
+            supportsAllDrives=True,
+        ).execute()
+        self.id_map[folder['id']] = created['id']
+        SUBTREE_COPY_ITEMS.labels(kind="folder", outcome="success").inc()
+        with self._lock:
+            self.folders_created += 1
+
+    def _copy_file(self, entry):
+        file, parent_id = entry
+        try:
+            copied = self.service().files().copy(
+                fileId=file['id'],
+                body={
+                    'name': file['name'],
+                    'parents': [self.id_map[parent_id]],
+                    'appProperties': {COPY_SOURCE_PROPERTY: file['id']},
+                },
+                fields="id",
+                supportsAllDrives=True,
+            ).execute()
+        except Exception as e:
+            # Ошибка одного файла не останавливает копию: он попадет в errors
+            SUBTREE_COPY_ITEMS.labels(kind="file", outcome="failure").inc()
+            with self._lock:
+                self.files_failed += 1
+                if len(self.errors) < ERRORS_KEPT:
+                    self.errors.append({"id": file['id'], "error": str(e)})
+            return
+        self.id_map[file['id']] = copied['id']
+        SUBTREE_COPY_ITEMS.labels(kind="file", outcome="success").inc()
+        with self._lock:
+            self.files_copied += 1
+
+    def progress(self, include_id_map=False):
+        finished_at = self.finished_at or time.time()
+        progress = {
+            "job_id": self.id,
+            "status": self.status,
+            "source_id": self.source_id,
+            "target_id": self.id_map.get(self.source_id),
+            "folders_total": self.folders_total,
+            "folders_created": self.folders_created,
+            "files_total": self.files_total,
+            "files_copied": self.files_copied,
+            "files_failed": self.files_failed,
+            "elapsed_seconds": round(finished_at - self.started_at, 1),
+            "error": self.error,
+            "errors": list(self.errors),
+        }
+        if include_id_map:
+            progress["id_map"] = dict(self.id_map)
+        return progress
+
+
+# Задачи живут в памяти воркера, который их запустил
+_jobs = OrderedDict()
+_running = set()
+_running_lock = threading.Lock()
+_executor = ThreadPoolExecutor(SUBTREE_COPY_MAX_JOBS, thread_name_prefix="subtree-copy-job")
+
+
+def register_job(job):
+    _jobs[job.id] = job
+    while len(_jobs) > SUBTREE_COPY_JOBS_KEPT:
+        _jobs.popitem(last=False)
+
+
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+
+def submit_job(job):
+    """Запускает задачу в отдельном пуле; False, если уже идут SUBTREE_COPY_MAX_JOBS задач."""
+    with _running_lock:
+        if len(_running) >= SUBTREE_COPY_MAX_JOBS:
+            return False
+        _running.add(job.id)
+    register_job(job)
+    future = _executor.submit(job.run)
+    future.add_done_callback(lambda _: _job_finished(job.id))
+    return True
+
+
+def _job_finished(job_id):
+    with _running_lock:
+        _running.discard(job_id)
+
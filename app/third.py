@@ -1,7 +1,6 @@
 from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
 from fastapi.responses import RedirectResponse, JSONResponse
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from google.oauth2.credentials import Credentials
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
@@ -14,16 +13,17 @@ from datetime import datetime, timedelta
 import time
 import imaplib
 from email.header import decode_header
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import asyncio
 
+from app.browser import create_driver, open_page, quit_driver, step
+from app.google_api import build_service
+from app.instrumentation import GoogleApiCallsMiddleware, setup_metrics
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -47,6 +47,8 @@ except Exception as e:
 fernet = Fernet(base64.urlsafe_b64encode(key))
 
 app = FastAPI()
+setup_metrics(app)
+app.add_middleware(GoogleApiCallsMiddleware)
 
 # Настройки OAuth 2.0
 CLIENT_SECRETS_FILE = "client_secrets.json"  # путь к вашему клиентскому секрету OAuth 2.0
@@ -143,7 +145,7 @@ async def check_emails(background_tasks: BackgroundTasks):
 # Подключение к почтовому ящику
 def connect_to_mail():
     creds = load_credentials()
-    service = build('gmail', 'v1', credentials=creds, cache_discovery=False)
+    service = build_service('gmail', 'v1', creds)
     return service
 
 # Получение новых писем
@@ -176,74 +178,76 @@ def check_and_process_emails():
         logger.error(f"An error occurred: {e}")
 
 def accept_invitation(email_id):
-    service = Service(ChromeDriverManager().install())
-    options = webdriver.ChromeOptions()
-    options.add_argument("--disable-dev-shm-usage")
-    #options.add_argument("--headless")  # Запуск в фоновом режиме
-    driver = webdriver.Chrome(service=service, options=options)
-    logger.info("Chrome driver initialized.")
+    driver = create_driver("accept_invitation", headless=False)
 
     try:
         # Открытие Gmail
-        driver.get("https://mail.google.com/")
+        open_page(driver, "https://mail.google.com/", "open_gmail")
         wait = WebDriverWait(driver, 30)
 
         # Вход в Google аккаунт
-        email_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='email']")))
-        email_input.send_keys(os.getenv("GMAIL_USERNAME"))
-        email_input.send_keys(Keys.RETURN)
+        with step(driver, "enter_email"):
+            email_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='email']")))
+            email_input.send_keys(os.getenv("GMAIL_USERNAME"))
+            email_input.send_keys(Keys.RETURN)
         time.sleep(2)
 
-        password_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='password']")))
-        password_input.send_keys(os.getenv("GMAIL_PASSWORD"))
-        password_input.send_keys(Keys.RETURN)
+        with step(driver, "enter_password"):
+            password_input = wait.until(EC.visibility_of_element_located((By.XPATH, "//input[@type='password']")))
+            password_input.send_keys(os.getenv("GMAIL_PASSWORD"))
+            password_input.send_keys(Keys.RETURN)
         time.sleep(5)
 
         # Ожидание загрузки инбокса
-        wait.until(EC.presence_of_element_located((By.XPATH, "//div[@role='main']")))
+        with step(driver, "wait_inbox"):
+            wait.until(EC.presence_of_element_located((By.XPATH, "//div[@role='main']")))
 
         # Открытие письма по ID
         email_url = f"https://mail.google.com/mail/u/0/#inbox/{email_id}"
-        driver.get(email_url)
+        open_page(driver, email_url, "open_email")
         logger.info(f"Opened the email with ID {email_id}")
         time.sleep(2)
 
         # Нахождение и нажатие кнопки "In new window" с использованием полного XPATH
-        new_window_button = wait.until(EC.element_to_be_clickable((By.XPATH, '/html/body/div[7]/div[3]/div/div[2]/div[2]/div/div/div/div[2]/div/div[1]/div/div[2]/div/div[2]/div[1]/div/div[1]/div/span[4]/button/div')))
-        new_window_button.click()
+        with step(driver, "click_new_window"):
+            new_window_button = wait.until(EC.element_to_be_clickable((By.XPATH, '/html/body/div[7]/div[3]/div/div[2]/div[2]/div/div/div/div[2]/div/div[1]/div/div[2]/div/div[2]/div[1]/div/div[1]/div/span[4]/button/div')))
+            new_window_button.click()
         time.sleep(1)  # Ожидание после нажатия
         logger.info("Clicked the 'In new window' button.")
 
         # Переключение на новую вкладку
-        wait.until(EC.number_of_windows_to_be(2))  # Ожидание открытия второй вкладки
-        driver.switch_to.window(driver.window_handles[-1])  # Переключение на последнюю открытую вкладку
+        with step(driver, "switch_to_email_tab"):
+            wait.until(EC.number_of_windows_to_be(2))  # Ожидание открытия второй вкладки
+            driver.switch_to.window(driver.window_handles[-1])  # Переключение на последнюю открытую вкладку
         logger.info("Switched to new tab.")
         logger.info(f"2 window handles before switch: {driver.window_handles}")
         time.sleep(2)
 
         # Нахождение и нажатие кнопки "Responde" с использованием полного XPATH
-        respond_button = wait.until(EC.element_to_be_clickable((By.XPATH, '/html/body/div[4]/div[2]/div/div[3]/div/div[2]/div[2]/div[1]/div/div[2]/div/div[3]/div[2]/div/div[3]/div/div/div/div/div/div[1]/div[2]/div[3]/div[3]/div[1]/div/table/tbody/tr/td/table/tbody/tr/td/table[1]/tbody/tr/td/div[2]/a')))
-        respond_button.click()
+        with step(driver, "click_respond"):
+            respond_button = wait.until(EC.element_to_be_clickable((By.XPATH, '/html/body/div[4]/div[2]/div/div[3]/div/div[2]/div[2]/div[1]/div/div[2]/div/div[3]/div[2]/div/div[3]/div/div/div/div/div/div[1]/div[2]/div[3]/div[3]/div[1]/div/table/tbody/tr/td/table/tbody/tr/td/table[1]/tbody/tr/td/div[2]/a')))
+            respond_button.click()
         logger.info("Clicked the 'Responde' button.")
         time.sleep(10)
 
         # Ожидание открытия новой вкладки и переключение на неё
-        wait.until(EC.number_of_windows_to_be(3))  # Ожидание открытия новой вкладки
-        logger.info(f"All window handles before switch: {driver.window_handles}")
-        driver.switch_to.window(driver.window_handles[-1])  # Переключение на последнюю открытую вкладку
+        with step(driver, "switch_to_invitation_tab"):
+            wait.until(EC.number_of_windows_to_be(3))  # Ожидание открытия новой вкладки
+            logger.info(f"All window handles before switch: {driver.window_handles}")
+            driver.switch_to.window(driver.window_handles[-1])  # Переключение на последнюю открытую вкладку
         logger.info(f"Current window handle after switch: {driver.current_window_handle}")
         time.sleep(5)
 
 
-        actions = ActionChains(driver)
-        actions.send_keys(Keys.RETURN).perform()
+        with step(driver, "confirm"):
+            actions = ActionChains(driver)
+            actions.send_keys(Keys.RETURN).perform()
         print("Pressed the 'Enter' key.")
 
     except Exception as e:
         logger.error(f"An error occurred while accepting the invitation: {e}")
     finally:
-        driver.quit()
-        logger.info("Chrome driver quit.")
+        quit_driver(driver)
 
 
 
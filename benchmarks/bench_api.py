@@ -0,0 +1,112 @@
+"""Бенчмарки работы с Drive/Gmail на локальном стенде (benchmarks/fake_google.py).
+
+    python benchmarks/bench_api.py --depth 3 --folders 10 --files 20 --latency-ms 10 --json result.json
+
+Меряются list_all_files, get_file_hierarchy, copy_files (copy_owner_files),
+copy_subtree (SubtreeCopyJob на все дерево) и check_and_process_emails из app.release. Для каждого сценария выводятся
+медиана и минимум по повторам, число вызовов API по счетчикам стенда
+и размер результата. Браузерная часть принятия приглашения (accept_invitation)
+здесь не запускается: ее шаги меряет selenium_step_duration_seconds.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_google import ROOT_ID, add_arguments, fake_options, run_fake_google
+
+
+def fake_request(base_url, path, method="GET"):
+    request = urllib.request.Request(base_url + path, method=method)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def api_calls(stats):
+    return sum(count for route, count in stats.items() if not route.startswith("injected_"))
+
+
+def measure(name, base_url, func, runs, reset=True):
+    timings = []
+    calls = 0
+    result = None
+    for _ in range(runs):
+        if reset:
+            fake_request(base_url, "_reset", "POST")
+        before = api_calls(fake_request(base_url, "_stats"))
+        start_time = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start_time)
+        calls = api_calls(fake_request(base_url, "_stats")) - before
+    row = {
+        "name": name,
+        "runs": runs,
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "api_calls": calls,
+        "items": len(result) if isinstance(result, (list, dict)) else None,
+    }
+    print(f"{name:<28} {row['median_s']:9.3f} s  {row['min_s']:9.3f} s  {calls:8d}  {row['items'] or '-':>8}",
+          flush=True)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--qps", type=float, default=None,
+                        help="лимит запросов к API в секунду, 0 - без лимита; по умолчанию - лимиты приложения")
+    parser.add_argument("--owner", default="owner1@example.com", help="владелец файлов для copy_files")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args()
+
+    with run_fake_google(**fake_options(args)) as base_url, tempfile.TemporaryDirectory() as tmp:
+        # Настройки читаются при импорте модулей приложения
+        os.environ["GOOGLE_API_ENDPOINT"] = base_url
+        if args.qps is not None:
+            os.environ["GOOGLE_DRIVE_QPS"] = os.environ["GOOGLE_GMAIL_QPS"] = str(args.qps)
+        os.environ["CREDENTIALS_FILE"] = os.path.join(tmp, "credentials.json")
+        os.environ.setdefault("SECRET_KEY", base64.urlsafe_b64encode(os.urandom(32)).decode())
+
+        from google.oauth2.credentials import Credentials
+
+        from app import release
+        from app.subtree_copy import SubtreeCopyJob
+
+        credentials = Credentials(token="fake-token")
+        release.save_credentials(credentials)
+        release.accept_invitation = lambda email_id: None
+        service = release.build_service("drive", "v3", credentials)
+        deepest_file = ROOT_ID + ".0" * args.depth + ":0"
+
+        tree = fake_request(base_url, "healthz")
+        print(f"Tree: {tree['folders']} folders, {tree['files']} files; {tree['messages']} messages; "
+              f"latency {args.latency_ms} ms")
+        print(f"{'benchmark':<28} {'median':>11}  {'min':>11}  {'calls':>8}  {'items':>8}")
+        results = [
+            measure("list_all_files", base_url, lambda: release.list_all_files(service, ROOT_ID), args.runs),
+            measure("get_file_hierarchy", base_url, lambda: release.get_file_hierarchy(service, deepest_file),
+                    args.runs),
+            measure("copy_files", base_url, lambda: release.copy_owner_files(credentials, args.owner), args.runs),
+            measure("copy_subtree", base_url, lambda: SubtreeCopyJob(
+                lambda: release.build_service("drive", "v3", credentials), ROOT_ID).run(), args.runs),
+            measure("check_and_process_emails", base_url, lambda: asyncio.run(release.check_and_process_emails()),
+                    args.runs),
+        ]
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"options": fake_options(args), "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+"""Локальный стенд Drive v3 и Gmail v1 для бенчмарков.
+
+    python benchmarks/fake_google.py --port 8765 --depth 3 --folders 10 --files 20 --latency-ms 20
+
+Приложение направляется на стенд через GOOGLE_API_ENDPOINT=http://127.0.0.1:8765/.
+
+Дерево папок синтетическое и генерируется лениво, по id: корень "Baggins Coffee"
+имеет id "d", его подпапки - "d.0", "d.1"..., файлы - "d:0", "d.1:5". Общие диски
+(--shared-drives) устроены так же, их корни - "sd0", "sd1"... Родитель
+вычисляется из id, поэтому дерево на миллион файлов не занимает память.
+Созданные папки, копии и прочитанные письма хранятся в памяти процесса.
+
+Поддерживаются только те запросы, которые делает приложение:
+files.list (q по parents, name, owners, appProperties; corpora=drive), files.get,
+files.create, files.copy, drives.list, users.getProfile, users.messages.list (q=is:unread), users.messages.get, users.messages.modify.
+Как и в Drive, элементы общих дисков видны только с supportsAllDrives=true
+и includeItemsFromAllDrives=true. Служебные /_stats и /_reset отдают счетчики
+и сбрасывают состояние.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+FOLDER_MIME = "application/vnd.google-apps.folder"
+FILE_MIME = "application/vnd.google-apps.document"
+ROOT_ID = "d"
+ROOT_NAME = "Baggins Coffee"
+MY_DRIVE_ID = "root"
+SHARED_DRIVE_PREFIX = "sd"
+SHARE_SENDER = "Google Drive <drive-shares-dm-noreply@google.com>"
+
+OWNERS = [f"owner{i}@example.com" for i in range(9)] + ["kolomojcysuai@gmail.com"]
+
+PARENT_RE = re.compile(r"'([^']+)'\s+in\s+parents")
+OWNER_RE = re.compile(r"'([^']+)'\s+in\s+owners")
+ID_SEPARATORS_RE = re.compile(r"[.:]")
+NAME_RE = re.compile(r"name\s*=\s*'([^']+)'")
+APP_PROPERTY_RE = re.compile(r"appProperties\s+has\s+\{\s*key\s*=\s*'([^']+)'\s+and\s+value\s*=\s*'([^']+)'\s*\}")
+
+
+class FakeGoogle:
+    def __init__(self, depth=3, folders=5, files=20, messages=200, share_ratio=0.1,
+                 recent_ratio=0.05, latency_ms=0.0, jitter_ms=0.0, rate_limit_ratio=0.0,
+                 user_rate_limit_ratio=0.0, retry_after=0, shared_drives=0, seed=0):
+        self.depth = depth
+        self.folders = folders
+        self.files = files
+        self.messages = messages
+        self.share_ratio = share_ratio
+        self.recent_ratio = recent_ratio
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_limit_ratio = rate_limit_ratio
+        self.user_rate_limit_ratio = user_rate_limit_ratio
+        self.retry_after = retry_after
+        self.shared_drives = [f"{SHARED_DRIVE_PREFIX}{i}" for i in range(shared_drives)]
+        self.roots = {ROOT_ID, *self.shared_drives}
+        self.random = random.Random(seed)
+        self.started_at = datetime.now(timezone.utc)
+        self.reset()
+
+    def reset(self):
+        self.copies = {}
+        self.read = set()
+        self.stats = Counter()
+
+    @property
+    def total_folders(self):
+        return len(self.roots) * sum(self.folders ** level for level in range(self.depth + 1))
+
+    @property
+    def total_files(self):
+        return self.total_folders * self.files
+
+    # --- дерево ---
+
+    def is_folder(self, item_id):
+        if item_id in self.copies:
+            return self.copies[item_id]["mimeType"] == FOLDER_MIME
+        return self.root_of(item_id) in self.roots and ":" not in item_id
+
+    def root_of(self, item_id):
+        return ID_SEPARATORS_RE.split(item_id, 1)[0]
+
+    def drive_of(self, item_id):
+        """id общего диска элемента или None для My Drive."""
+        if item_id in self.copies:
+            return self.copies[item_id].get("driveId")
+        root = self.root_of(item_id)
+        return root if root in self.shared_drives else None
+
+    def exists(self, item_id):
+        if item_id in self.copies or item_id == MY_DRIVE_ID:
+            return True
+        if self.root_of(item_id) not in self.roots:
+            return False
+        folder, _, file_index = item_id.partition(":")
+        path = folder.split(".")[1:]
+        if len(path) > self.depth or any(not part.isdigit() or int(part) >= self.folders for part in path):
+            return False
+        return not file_index or (file_index.isdigit() and int(file_index) < self.files)
+
+    def parent_of(self, item_id):
+        if item_id in self.copies:
+            return self.copies[item_id]["parents"][0]
+        if item_id == ROOT_ID:
+            return MY_DRIVE_ID
+        if item_id in self.shared_drives:
+            return None
+        if ":" in item_id:
+            return item_id.split(":", 1)[0]
+        return item_id.rsplit(".", 1)[0]
+
+    def metadata(self, item_id):
+        if item_id in self.copies:
+            return self.copies[item_id]
+        if item_id == MY_DRIVE_ID:
+            return {"id": MY_DRIVE_ID, "name": "My Drive", "mimeType": FOLDER_MIME}
+
+        digest = zlib.crc32(item_id.encode())
+        # Небольшая доля файлов свежая, остальные разбросаны по последним 30 дням
+        if digest % 1000 < self.recent_ratio * 1000:
+            age = timedelta(seconds=digest % 600)
+        else:
+            age = timedelta(minutes=30 + digest % (30 * 24 * 60))
+        owner = OWNERS[digest % len(OWNERS)]
+        folder = self.is_folder(item_id)
+        if item_id == ROOT_ID:
+            name = ROOT_NAME
+        elif item_id in self.shared_drives:
+            name = f"Shared drive {item_id}"
+        else:
+            name = f"Folder {item_id}" if folder else f"File {item_id}"
+        metadata = {
+            "id": item_id,
+            "name": name,
+            "mimeType": FOLDER_MIME if folder else FILE_MIME,
+            "createdTime": (self.started_at - age).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+        }
+        if parent_id := self.parent_of(item_id):
+            metadata["parents"] = [parent_id]
+        # Файлы общего диска принадлежат диску, а не пользователю: owners у них нет
+        if drive_id := self.drive_of(item_id):
+            metadata["driveId"] = drive_id
+        else:
+            metadata["owners"] = [{"emailAddress": owner, "displayName": owner.split("@")[0]}]
+        return metadata
+
+    def placement(self, parent_id):
+        """Поля владения нового элемента: driveId в общем диске, иначе владелец - мы."""
+        if drive_id := self.drive_of(parent_id):
+            return {"driveId": drive_id}
+        return {"owners": [{"emailAddress": "me@example.com", "displayName": "me"}]}
+
+    def children(self, folder_id):
+        if folder_id == MY_DRIVE_ID:
+            yield ROOT_ID
+        elif folder_id not in self.copies and self.is_folder(folder_id) and self.exists(folder_id):
+            if folder_id.count(".") < self.depth:
+                for i in range(self.folders):
+                    yield f"{folder_id}.{i}"
+            for i in range(self.files):
+                yield f"{folder_id}:{i}"
+        for copy_id, copy in self.copies.items():
+            if copy["parents"][0] == folder_id:
+                yield copy_id
+
+    def walk(self):
+        pending = [ROOT_ID]
+        while pending:
+            folder_id = pending.pop()
+            yield folder_id
+            for child_id in self.children(folder_id):
+                if self.is_folder(child_id):
+                    pending.append(child_id)
+                else:
+                    yield child_id
+
+    # --- Gmail ---
+
+    def message(self, message_id):
+        index = int(message_id[1:])
+        share = self.share_ratio and index % max(1, round(1 / self.share_ratio)) == 0
+        sender = SHARE_SENDER if share else f"user{index}@example.com"
+        labels = ["INBOX"] + ([] if message_id in self.read else ["UNREAD"])
+        return {
+            "id": message_id,
+            "threadId": message_id,
+            "labelIds": labels,
+            "payload": {"headers": [{"name": "From", "value": sender}, {"name": "Subject", "value": f"Message {index}"}]},
+        }
+
+    def message_exists(self, message_id):
+        return message_id[:1] == "m" and message_id[1:].isdigit() and int(message_id[1:]) < self.messages
+
+    # --- ошибки и задержка ---
+
+    async def delay_or_fail(self, route):
+        self.stats[route] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+        roll = self.random.random()
+        if roll < self.rate_limit_ratio:
+            self.stats["injected_429"] += 1
+            return error_response(429, "rateLimitExceeded", "Rate Limit Exceeded", self.retry_after)
+        if roll < self.rate_limit_ratio + self.user_rate_limit_ratio:
+            self.stats["injected_403"] += 1
+            return error_response(403, "userRateLimitExceeded", "User Rate Limit Exceeded", self.retry_after)
+        return None
+
+
+def error_response(status, reason, message, retry_after=None):
+    headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+    return JSONResponse(
+        {"error": {"code": status, "message": message, "errors": [{"reason": reason, "message": message}]}},
+        status_code=status, headers=headers,
+    )
+
+
+def page(items, page_size, page_token):
+    offset = int(page_token or 0)
+    chunk = items[offset:offset + page_size]
+    next_token = str(offset + page_size) if offset + page_size < len(items) else None
+    return chunk, next_token
+
+
+def create_app(fake):
+    app = FastAPI()
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"folders": fake.total_folders, "files": fake.total_files, "messages": fake.messages}
+
+    @app.get("/_stats")
+    async def stats():
+        return dict(fake.stats)
+
+    @app.post("/_reset")
+    async def reset():
+        fake.reset()
+        return {"message": "reset"}
+
+    def hidden_shared_item(request, *item_ids):
+        # Без supportsAllDrives элементы общих дисков для клиента не существуют
+        if request.query_params.get("supportsAllDrives") == "true":
+            return None
+        for item_id in item_ids:
+            if fake.drive_of(item_id):
+                return error_response(404, "notFound", f"File not found: {item_id}.")
+        return None
+
+    @app.get("/drive/v3/files")
+    async def files_list(request: Request):
+        if error := await fake.delay_or_fail("drive.files.list"):
+            return error
+        params = request.query_params
+        query = params.get("q", "")
+        page_size = min(int(params.get("pageSize", 100)), 1000)
+        offset = int(params.get("pageToken") or 0)
+        all_drives = params.get("supportsAllDrives") == "true" and params.get("includeItemsFromAllDrives") == "true"
+        if params.get("corpora") == "drive" and not (params.get("driveId") and all_drives):
+            return error_response(400, "invalid", "corpora=drive requires driveId and includeItemsFromAllDrives.")
+        drive_id = params.get("driveId") if params.get("corpora") == "drive" else None
+        if drive_id is not None and drive_id not in fake.shared_drives:
+            return error_response(404, "notFound", f"Shared drive not found: {drive_id}")
+
+        if properties := APP_PROPERTY_RE.findall(query):
+            # Условия appProperties has {...}, объединенные через or
+            wanted = set(properties)
+            ids = (copy_id for copy_id, copy in fake.copies.items()
+                   if wanted & set(copy.get("appProperties", {}).items()))
+        elif parent := PARENT_RE.search(query):
+            # Без includeItemsFromAllDrives содержимое общих дисков не возвращается
+            # С corpora=drive видны только элементы этого диска
+            visible = (all_drives or not fake.drive_of(parent.group(1))) and (
+                drive_id is None or fake.drive_of(parent.group(1)) == drive_id)
+            ids = fake.children(parent.group(1)) if visible else iter([])
+        elif owner := OWNER_RE.search(query):
+            ids = (item_id for item_id in fake.walk()
+                   if fake.metadata(item_id)["owners"][0]["emailAddress"] == owner.group(1))
+        elif (name := NAME_RE.search(query)) and name.group(1) == ROOT_NAME:
+            ids = iter([ROOT_ID])
+        else:
+            ids = iter([])
+
+        # Берем на один элемент больше страницы, чтобы понять, есть ли следующая
+        chunk = list(itertools.islice(ids, offset, offset + page_size + 1))
+        result = {"files": [fake.metadata(item_id) for item_id in chunk[:page_size]]}
+        if len(chunk) > page_size:
+            result["nextPageToken"] = str(offset + page_size)
+        return result
+
+    @app.get("/drive/v3/files/{file_id}")
+    async def files_get(file_id: str, request: Request):
+        if error := await fake.delay_or_fail("drive.files.get"):
+            return error
+        if not fake.exists(file_id):
+            return error_response(404, "notFound", f"File not found: {file_id}.")
+        return hidden_shared_item(request, file_id) or fake.metadata(file_id)
+
+    @app.get("/drive/v3/drives")
+    async def drives_list(request: Request):
+        if error := await fake.delay_or_fail("drive.drives.list"):
+            return error
+        params = request.query_params
+        drives, next_token = page(fake.shared_drives, min(int(params.get("pageSize", 10)), 100), params.get("pageToken"))
+        result = {"drives": [{"kind": "drive#drive", "id": drive_id, "name": fake.metadata(drive_id)["name"]}
+                             for drive_id in drives]}
+        if next_token:
+            result["nextPageToken"] = next_token
+        return result
+
+    @app.post("/drive/v3/files")
+    async def files_create(request: Request):
+        if error := await fake.delay_or_fail("drive.files.create"):
+            return error
+        body = await request.json()
+        parents = body.get("parents") or [MY_DRIVE_ID]
+        if error := hidden_shared_item(request, *parents):
+            return error
+        item_id = f"copy{len(fake.copies)}"
+        fake.copies[item_id] = {
+            "id": item_id,
+            "name": body.get("name", "Untitled"),
+            "mimeType": body.get("mimeType", FILE_MIME),
+            "parents": parents,
+            "appProperties": body.get("appProperties", {}),
+            **fake.placement(parents[0]),
+            "createdTime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+        }
+        return fake.copies[item_id]
+
+    @app.post("/drive/v3/files/{file_id}/copy")
+    async def files_copy(file_id: str, request: Request):
+        if error := await fake.delay_or_fail("drive.files.copy"):
+            return error
+        if not fake.exists(file_id):
+            return error_response(404, "notFound", f"File not found: {file_id}.")
+        body = await request.json() if await request.body() else {}
+        source = fake.metadata(file_id)
+        parents = body.get("parents") or source["parents"]
+        if error := hidden_shared_item(request, file_id, *parents):
+            return error
+        copy_id = f"copy{len(fake.copies)}"
+        fake.copies[copy_id] = {
+            **{key: value for key, value in source.items() if key not in ("owners", "driveId")},
+            "id": copy_id,
+            "name": body.get("name", f"Copy of {source['name']}"),
+            "parents": parents,
+            "appProperties": {**source.get("appProperties", {}), **body.get("appProperties", {})},
+            **fake.placement(parents[0]),
+            "createdTime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+        }
+        return fake.copies[copy_id]
+
+    @app.get("/gmail/v1/users/{user_id}/profile")
+    async def profile():
+        if error := await fake.delay_or_fail("gmail.users.getProfile"):
+            return error
+        return {"emailAddress": "me@example.com", "messagesTotal": fake.messages,
+                "threadsTotal": fake.messages, "historyId": "1"}
+
+    @app.get("/gmail/v1/users/{user_id}/messages")
+    async def messages_list(request: Request):
+        if error := await fake.delay_or_fail("gmail.users.messages.list"):
+            return error
+        params = request.query_params
+        ids = [f"m{i}" for i in range(fake.messages)]
+        if "is:unread" in params.get("q", ""):
+            ids = [message_id for message_id in ids if message_id not in fake.read]
+        chunk, next_token = page(ids, min(int(params.get("maxResults", 100)), 500), params.get("pageToken"))
+        result = {"messages": [{"id": message_id, "threadId": message_id} for message_id in chunk],
+                  "resultSizeEstimate": len(ids)}
+        if next_token:
+            result["nextPageToken"] = next_token
+        return result
+
+    @app.get("/gmail/v1/users/{user_id}/messages/{message_id}")
+    async def messages_get(message_id: str):
+        if error := await fake.delay_or_fail("gmail.users.messages.get"):
+            return error
+        if not fake.message_exists(message_id):
+            return error_response(404, "notFound", "Requested entity was not found.")
+        return fake.message(message_id)
+
+    @app.post("/gmail/v1/users/{user_id}/messages/{message_id}/modify")
+    async def messages_modify(message_id: str, request: Request):
+        if error := await fake.delay_or_fail("gmail.users.messages.modify"):
+            return error
+        if not fake.message_exists(message_id):
+            return error_response(404, "notFound", "Requested entity was not found.")
+        body = await request.json()
+        if "UNREAD" in body.get("removeLabelIds", []):
+            fake.read.add(message_id)
+        if "UNREAD" in body.get("addLabelIds", []):
+            fake.read.discard(message_id)
+        return fake.message(message_id)
+
+    return app
+
+
+def add_arguments(parser):
+    parser.add_argument("--depth", type=int, default=3, help="уровней подпапок под корнем")
+    parser.add_argument("--folders", type=int, default=5, help="подпапок в каждой папке")
+    parser.add_argument("--files", type=int, default=20, help="файлов в каждой папке")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--share-ratio", type=float, default=0.1, help="доля писем о предоставлении доступа")
+    parser.add_argument("--recent-ratio", type=float, default=0.05, help="доля файлов моложе 10 минут")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--user-rate-limit-ratio", type=float, default=0.0, help="доля ответов 403 userRateLimitExceeded")
+    parser.add_argument("--retry-after", type=int, default=0)
+    parser.add_argument("--shared-drives", type=int, default=0, help="общих дисков с таким же деревом")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def fake_options(args):
+    return {name: getattr(args, name) for name in (
+        "depth", "folders", "files", "messages", "share_ratio", "recent_ratio", "latency_ms", "jitter_ms",
+        "rate_limit_ratio", "user_rate_limit_ratio", "retry_after", "shared_drives", "seed",
+    )}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                return response.read()
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+@contextlib.contextmanager
+def run_fake_google(**options):
+    """Запускает стенд в отдельном процессе, чтобы он не делил GIL с измеряемым кодом.
+    Возвращает базовый URL для GOOGLE_API_ENDPOINT."""
+    port = free_port()
+    command = [sys.executable, os.path.abspath(__file__), "--port", str(port), "--log-level", "warning"]
+    for name, value in options.items():
+        command += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command)
+    base_url = f"http://127.0.0.1:{port}/"
+    try:
+        wait_ready(base_url + "healthz")
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--log-level", default="info")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = FakeGoogle(**fake_options(args))
+    print(f"Fake Google: {fake.total_folders} folders, {fake.total_files} files, {fake.messages} messages", flush=True)
+    uvicorn.run(create_app(fake), host=args.host, port=args.port, log_level=args.log_level, access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+"""Нагрузочный тест app.release на локальном стенде Google (benchmarks/fake_google.py).
+
+    python benchmarks/load_test.py --rps 10 --duration 30
+    python benchmarks/load_test.py --save-baseline
+
+Поднимает стенд и приложение (uvicorn в отдельных процессах) и подает смешанную
+нагрузку с постоянной интенсивностью (open loop): запросы отправляются по
+расписанию, не дожидаясь ответов на предыдущие, а задержка считается от
+запланированного момента. Поэтому блокировка event loop видна в p99, а не
+прячется за снижением темпа.
+
+По каждому маршруту выводятся пропускная способность, p50/p95/p99 и доля ошибок
+(ответы 5xx и сетевые ошибки). Результат сравнивается с базовым: код возврата 1,
+если успешных ответов в секунду меньше --rps больше чем на --rps-tolerance, есть
+хоть один 503 на маршруте без ошибок в базовом прогоне, p50 вырос больше чем на
+--threshold, p95/p99 - больше чем на --tail-threshold (и на --slack-ms), или доля
+ошибок - больше статистического разброса и --error-slack. Хвосты при открытой
+нагрузке шумные, поэтому допуск для них шире, а перцентили по слишком малой
+выборке не сравниваются.
+
+Базовый прогон должен быть без перегрузки: если приложение отбрасывало запросы
+(503) или не держало --rps, с ним не сравнивают и не сохраняют его - задержки и
+ошибки перегруженного прогона ничего не говорят о регрессиях. Тогда нужно снизить
+--rps или долю тяжелых маршрутов в --mix.
+
+Базовые значения зависят от машины. Надежнее всего сравнивать с прогоном базового
+коммита на той же машине (его дерево разворачивается через git worktree):
+
+    python benchmarks/load_test.py --base-ref origin/main
+
+Без --base-ref сравнение идет с benchmarks/baselines/load_test.json; после смены
+окружения его нужно перезаписать через --save-baseline.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+from cryptography.fernet import Fernet
+
+from fake_google import OWNERS, ROOT_ID, add_arguments, fake_options, free_port, run_fake_google, wait_ready
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "load_test.json")
+# Первая копия владельца - тысячи вызовов API, поэтому copy-files в смеси редкий:
+# при большей доле или темпе приложение отбрасывает запросы и прогон перегружен
+DEFAULT_MIX = "files=40,file-hierarchy=30,copy-files=2,metrics=28"
+PERCENTILES = (50, 95, 99)
+# Перцентиль по малой выборке - почти максимум, сравнивать его бессмысленно
+MIN_SAMPLES = {50: 10, 95: 40, 99: 200}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        route, _, weight = part.partition("=")
+        mix[route.strip()] = float(weight)
+    return mix
+
+
+def random_item_id(rng, args):
+    path = "".join(f".{rng.randrange(args.folders)}" for _ in range(rng.randint(0, args.depth)))
+    return f"{ROOT_ID}{path}:{rng.randrange(args.files)}" if args.files else ROOT_ID + path
+
+
+def make_request(route, rng, args):
+    """(метод, путь) для маршрута из смеси."""
+    if route == "files":
+        return "GET", "/files"
+    if route == "file-hierarchy":
+        return "GET", f"/file-hierarchy/{random_item_id(rng, args)}"
+    if route == "copy-files":
+        return "POST", f"/copy-files/{rng.choice(OWNERS)}"
+    if route == "metrics":
+        return "GET", "/metrics"
+    raise ValueError(f"Unknown route in mix: {route}")
+
+
+def write_credentials(path, secret_key):
+    # Тот же формат, что у save_credentials в app.release
+    data = {
+        "token": "fake-token",
+        "refresh_token": None,
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "client_id": None,
+        "client_secret": None,
+        "scopes": None,
+    }
+    with open(path, "w") as file:
+        file.write(Fernet(secret_key.encode()).encrypt(json.dumps(data).encode()).decode())
+
+
+def start_app(api_url, tmp, args, root=ROOT):
+    env = dict(os.environ)
+    secret_key = env.setdefault("SECRET_KEY", base64.urlsafe_b64encode(os.urandom(32)).decode())
+    credentials_file = os.path.join(tmp, "credentials.json")
+    write_credentials(credentials_file, secret_key)
+    env.update({
+        "GOOGLE_API_ENDPOINT": api_url,
+        "CREDENTIALS_FILE": credentials_file,
+        "CLIENT_SECRETS_FILE": os.path.join(tmp, "client_secrets.json"),
+        "PYTHONPATH": root + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    # Без --qps приложение работает с лимитами по умолчанию, как в продакшене
+    for name in ("GOOGLE_DRIVE_QPS", "GOOGLE_GMAIL_QPS"):
+        if args.qps is None:
+            env.pop(name, None)
+        else:
+            env[name] = str(args.qps)
+    if args.workers > 1:
+        env["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(tmp, "metrics")
+
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.release:app", "--port", str(port), "--workers", str(args.workers),
+         "--log-level", "warning", "--no-access-log"],
+        env=env, cwd=root,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    wait_ready(base_url + "/metrics")
+    return process, base_url
+
+
+async def run_load(base_url, args):
+    mix = parse_mix(args.mix)
+    routes, weights = list(mix), list(mix.values())
+    rng = random.Random(args.seed)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    statuses = defaultdict(lambda: defaultdict(int))
+
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        async def fire(route, method, path, scheduled):
+            try:
+                response = await client.request(method, path)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latency = time.perf_counter() - scheduled
+            latencies[route].append(latency)
+            statuses[route][str(status)] += 1
+            if not isinstance(status, int) or status >= 500:
+                errors[route] += 1
+
+        total = int(args.rps * args.duration)
+        interval = 1 / args.rps
+        tasks = []
+        start_time = time.perf_counter()
+        for i in range(total):
+            scheduled = start_time + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            route = rng.choices(routes, weights)[0]
+            method, path = make_request(route, rng, args)
+            tasks.append(asyncio.create_task(fire(route, method, path, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start_time
+
+    report = {}
+    for route in routes + ["all"]:
+        values = latencies[route] if route != "all" else [v for r in routes for v in latencies[r]]
+        failed = errors[route] if route != "all" else sum(errors.values())
+        if not values:
+            continue
+        report[route] = {
+            "requests": len(values),
+            "throughput_rps": len(values) / elapsed,
+            "error_rate": failed / len(values),
+            **{f"p{p}_ms": percentile(values, p) * 1000 for p in PERCENTILES},
+        }
+        if route != "all":
+            report[route]["statuses"] = dict(statuses[route])
+    return report
+
+
+def print_report(report):
+    print(f"{'route':<16} {'requests':>9} {'rps':>8} {'errors':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, row in report.items():
+        print(f"{route:<16} {row['requests']:9d} {row['throughput_rps']:8.1f} {row['error_rate']:8.2%} "
+              f"{row['p50_ms']:9.1f} {row['p95_ms']:9.1f} {row['p99_ms']:9.1f}")
+
+
+def achieved_rps(report):
+    """Успешных ответов в секунду за весь прогон."""
+    total = report["all"]
+    return total["throughput_rps"] * (1 - total["error_rate"])
+
+
+def overload(report, rps, tolerance):
+    """Признаки перегрузки прогона: не держит темп rps или отбрасывает запросы."""
+    problems = []
+    if achieved_rps(report) < rps * (1 - tolerance):
+        problems.append(f"achieved {achieved_rps(report):.1f} successful rps < target {rps:g}")
+    for route, row in report.items():
+        shed = row.get("statuses", {}).get("503", 0)
+        if shed:
+            problems.append(f"{route}: {shed} responses 503")
+    return problems
+
+
+def compare(report, baseline, args):
+    """Список регрессий относительно базовых значений."""
+    regressions = []
+    if achieved_rps(report) < args.rps * (1 - args.rps_tolerance):
+        regressions.append(f"throughput: {achieved_rps(report):.1f} successful rps < target {args.rps:g}")
+    for route, base in baseline["routes"].items():
+        row = report.get(route)
+        if row is None:
+            continue
+        shed = row.get("statuses", {}).get("503", 0)
+        if shed and base["error_rate"] == 0:
+            regressions.append(f"{route}: {shed} responses 503, baseline had no errors")
+        samples = min(row["requests"], base["requests"])
+        for p in PERCENTILES:
+            if samples < MIN_SAMPLES[p]:
+                continue
+            key = f"p{p}_ms"
+            threshold = args.threshold if p == 50 else args.tail_threshold
+            limit = base[key] * (1 + threshold) + args.slack_ms
+            if row[key] > limit:
+                regressions.append(f"{route} {key}: {row[key]:.1f} > {limit:.1f} (baseline {base[key]:.1f})")
+        # Допуск - три стандартных отклонения доли ошибок на такой выборке, но не меньше error_slack
+        rate = max(base["error_rate"], 1 / row["requests"])
+        limit = base["error_rate"] + max(args.error_slack, 3 * math.sqrt(rate * (1 - rate) / row["requests"]))
+        if row["error_rate"] > limit:
+            regressions.append(f"{route} error_rate: {row['error_rate']:.2%} > {limit:.2%} "
+                               f"(baseline {base['error_rate']:.2%})")
+    return regressions
+
+
+def measure(args, root=ROOT):
+    """Отчет по маршрутам для дерева приложения в root; стенд каждый раз новый."""
+    # Письма о доступе по умолчанию не генерируются: их обработка запускает браузер
+    with run_fake_google(**fake_options(args)) as api_url, tempfile.TemporaryDirectory() as tmp:
+        process, base_url = start_app(api_url, tmp, args, root)
+        try:
+            print(f"Load: {args.rps} rps for {args.duration}s, mix {args.mix}, {args.workers} worker(s), "
+                  f"app from {root}", flush=True)
+            return asyncio.run(run_load(base_url, args))
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def measure_ref(args, ref):
+    """Тот же прогон для приложения из коммита ref (git worktree во временном каталоге)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tree = os.path.join(tmp, "tree")
+        subprocess.run(["git", "-C", ROOT, "worktree", "add", "--detach", "--quiet", tree, ref], check=True)
+        try:
+            return measure(args, tree)
+        finally:
+            subprocess.run(["git", "-C", ROOT, "worktree", "remove", "--force", tree], check=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.set_defaults(share_ratio=0.0, latency_ms=10.0)
+    parser.add_argument("--rps", type=float, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="маршрут=вес через запятую")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--qps", type=float, default=None,
+                        help="лимит приложения на вызовы API в секунду (GOOGLE_*_QPS), 0 - без лимита; "
+                             "по умолчанию - лимиты приложения")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--base-ref", help="сравнить с прогоном этого коммита на той же машине, а не с baseline")
+    parser.add_argument("--threshold", type=float, default=0.5, help="допустимый относительный рост p50")
+    parser.add_argument("--tail-threshold", type=float, default=1.5, help="допустимый относительный рост p95 и p99")
+    parser.add_argument("--slack-ms", type=float, default=50, help="допустимый абсолютный рост перцентиля")
+    parser.add_argument("--error-slack", type=float, default=0.02, help="минимальный допустимый рост доли ошибок")
+    parser.add_argument("--rps-tolerance", type=float, default=0.1,
+                        help="допустимая доля недобора успешных ответов в секунду относительно --rps")
+    parser.add_argument("--json", help="сохранить отчет в файл")
+    args = parser.parse_args()
+
+    base_report = None
+    if args.base_ref:
+        base_report = measure_ref(args, args.base_ref)
+        print(f"Base {args.base_ref}:")
+        print_report(base_report)
+    report = measure(args)
+
+    print_report(report)
+    result = {
+        "options": {"rps": args.rps, "duration": args.duration, "mix": args.mix, "workers": args.workers, "qps": args.qps,
+                    **fake_options(args)},
+        "routes": report,
+    }
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2)
+
+    if args.save_baseline:
+        problems = overload(report, args.rps, args.rps_tolerance)
+        if problems:
+            for problem in problems:
+                print(f"OVERLOAD: {problem}")
+            print("Baseline not saved: lower --rps or the share of heavy routes in --mix")
+            return 1
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(result, file, indent=2)
+            file.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if base_report is not None:
+        baseline = {"options": result["options"], "routes": base_report}
+    elif not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to create it")
+        return 0
+    else:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    if baseline["options"] != result["options"]:
+        print("WARNING: baseline was recorded with different options, comparison may be meaningless")
+    problems = overload(baseline["routes"], baseline["options"]["rps"], args.rps_tolerance)
+    if problems:
+        # Ошибки и задержки перегруженного базового прогона не с чем сравнивать
+        for problem in problems:
+            print(f"BASELINE OVERLOAD: {problem}")
+        print("FAIL: baseline is overloaded, re-record it with lower --rps or a lighter --mix")
+        return 1
+    regressions = compare(report, baseline, args)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    print("FAIL" if regressions else "OK: no regressions against baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Бенчмарк времени старта: импорт модуля приложения (вместе с create_app).
+
+    python benchmarks/startup.py --module app.release --budget-ms 900
+
+Импорт замеряется несколько раз в отдельных процессах, медиана сравнивается
+с бюджетом. Отчет по модулям берется из python -X importtime. Тяжелые
+зависимости из LAZY_MODULES не должны загружаться при импорте. Код возврата 1,
+если бюджет превышен или такой модуль загрузился.
+"""
+import argparse
+import base64
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Импортируются только внутри обработчиков и задач
+LAZY_MODULES = ["selenium", "webdriver_manager", "googleapiclient", "google_auth_oauthlib", "apscheduler"]
+
+
+def child_env():
+    env = dict(os.environ)
+    # release.py проверяет ключ при импорте
+    env.setdefault("SECRET_KEY", base64.urlsafe_b64encode(os.urandom(32)).decode())
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def import_wall_time(module, env):
+    start_time = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], env=env, cwd=ROOT, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start_time
+
+
+def import_times(module, env):
+    """{модуль: (self_us, cumulative_us)} из вывода -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, cwd=ROOT,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        # import time:       250 |      40729 |         asyncio
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.release")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", 900)))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    env = child_env()
+    # Интерпретатор без импорта модуля - чтобы отделить старт python от старта приложения
+    baseline = statistics.median(import_wall_time("sys", env) for _ in range(args.runs))
+    timings = [import_wall_time(args.module, env) for _ in range(args.runs)]
+    median_ms = (statistics.median(timings) - baseline) * 1000
+
+    modules = import_times(args.module, env)
+    print(f"Slowest imports of {args.module} (cumulative):")
+    for name, (self_us, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"  {cumulative_us / 1000:9.1f} ms  {self_us / 1000:8.1f} ms self  {name}")
+
+    loaded_lazy = [name for name in LAZY_MODULES if name in modules]
+    print(f"\nimport {args.module}: median {median_ms:.0f} ms over {args.runs} runs "
+          f"(interpreter start {baseline * 1000:.0f} ms excluded), budget {args.budget_ms:.0f} ms")
+
+    failed = False
+    if median_ms > args.budget_ms:
+        print(f"FAIL: startup is over budget by {median_ms - args.budget_ms:.0f} ms")
+        failed = True
+    if loaded_lazy:
+        print(f"FAIL: heavy modules are imported eagerly: {', '.join(loaded_lazy)}")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import base64
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+# Модули приложения читают настройки при импорте
+os.environ.setdefault("SECRET_KEY", base64.urlsafe_b64encode(os.urandom(32)).decode())
+os.environ.setdefault("CRAWL_CHECKPOINT_DIR", tempfile.mkdtemp(prefix="crawls-"))
+os.environ.setdefault("GOOGLE_DRIVE_QPS", "0")
+os.environ.setdefault("GOOGLE_GMAIL_QPS", "0")
+# Настройки БД нужны уже при импорте app.database; соединение открывается только в тестах с TEST_DATABASE=1
+if not os.path.exists(os.path.join(ROOT, ".env")):
+    for name, value in {"DB_HOST": "localhost", "DB_PORT": "5432", "DB_USER": "postgres", "DB_PASS": "postgres",
+                        "DB_NAME": "postgres"}.items():
+        os.environ.setdefault(name, value)
+
+
+@pytest.fixture(scope="session")
+def fake_google_url():
+    """Локальный стенд Drive/Gmail (benchmarks/fake_google.py) с одним общим диском."""
+    from fake_google import run_fake_google
+
+    with run_fake_google(depth=2, folders=2, files=3, shared_drives=1) as base_url:
+        yield base_url
+
+
+@pytest.fixture
+def drive_credentials(fake_google_url, monkeypatch):
+    from google.oauth2.credentials import Credentials
+
+    from app import google_api
+
+    monkeypatch.setattr(google_api, "GOOGLE_API_ENDPOINT", fake_google_url)
+    return Credentials(token="fake-token")
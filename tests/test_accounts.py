@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from app import release
+from app.accounts.dao import AccountsDAO
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """Аккаунты "в базе" и счетчик расшифровок."""
+    rows = [SimpleNamespace(email="a@example.com", credentials="a-1"), SimpleNamespace(email="b@example.com", credentials="b-1")]
+    decrypted = []
+
+    async def find_all(session=None):
+        return list(rows)
+
+    def deserialize(encrypted):
+        decrypted.append(encrypted)
+        return Credentials(token=encrypted)
+
+    monkeypatch.setattr(release, "ACCOUNTS_STORE", "db")
+    monkeypatch.setattr(release, "_decrypted_accounts", {})
+    monkeypatch.setattr(release, "deserialize_credentials", deserialize)
+    monkeypatch.setattr(AccountsDAO, "find_all", find_all)
+    return rows, decrypted
+
+
+def test_accounts_are_decrypted_once_until_credentials_change(stored):
+    rows, decrypted = stored
+
+    first = asyncio.run(release.load_accounts())
+    second = asyncio.run(release.load_accounts())
+    assert [email for email, _ in first] == ["a@example.com", "b@example.com"]
+    assert decrypted == ["a-1", "b-1"]
+    assert second[0][1] is first[0][1]
+
+    rows[0].credentials = "a-2"
+    third = asyncio.run(release.load_accounts())
+    assert decrypted == ["a-1", "b-1", "a-2"]
+    assert third[0][1].token == "a-2"
+
+
+def test_expired_accounts_are_refreshed_concurrently(stored, monkeypatch):
+    started = []
+
+    async def refresh_account(email, credentials):
+        started.append(email)
+        # Обновление завершается, только когда начались оба: последовательный цикл здесь зависнет
+        while len(started) < 2:
+            await asyncio.sleep(0.01)
+        return Credentials(token=f"{email}-fresh")
+
+    monkeypatch.setattr(release, "needs_refresh", lambda credentials: not credentials.token.endswith("-fresh"))
+    monkeypatch.setattr(release, "refresh_account", refresh_account)
+
+    accounts = asyncio.run(asyncio.wait_for(release.load_accounts(), timeout=5))
+    assert [credentials.token for _, credentials in accounts] == ["a@example.com-fresh", "b@example.com-fresh"]
@@ -0,0 +1,37 @@
+import json
+
+from app.browser import extract_elements
+
+
+class ScrollingDriver:
+    """Отдает заранее заданные снимки виртуализированного списка, по одному на прокрутку."""
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        self.calls = 0
+
+    def execute_script(self, script, *args):
+        snapshot = self.snapshots[min(self.calls, len(self.snapshots) - 1)]
+        self.calls += 1
+        return json.dumps(snapshot)
+
+
+def test_rows_with_same_text_are_kept_by_id():
+    first = [
+        {"text": "Отдел продаж", "href": None, "id": "g1"},
+        {"text": "Отдел продаж", "href": None, "id": "g2"},
+    ]
+    second = first[1:] + [{"text": "Отдел кадров", "href": None, "id": "g3"}]
+    driver = ScrollingDriver([first, second])
+
+    items = extract_elements(driver, "//span[@role='link']", scroll_pause=0)
+
+    assert [item["id"] for item in items] == ["g1", "g2", "g3"]
+
+
+def test_rows_without_href_or_id_fall_back_to_text():
+    rows = [{"text": "Team A", "href": None, "id": None}, {"text": "Team A", "href": None, "id": None}]
+
+    items = extract_elements(ScrollingDriver([rows]), "//span[@role='link']", scroll=False)
+
+    assert items == rows[:1]
@@ -0,0 +1,91 @@
+import re
+
+import pytest
+
+from app import crawler
+from app.crawler import FOLDER_MIME_TYPE, FolderCrawl
+
+FIELDS = "nextPageToken, files(id, name, mimeType, parents)"
+# Папка root: две вложенные папки и файлы; на странице два элемента, поэтому у папок несколько страниц
+TREE = {
+    "root": ["a", "b", "root-1", "root-2", "root-3"],
+    "a": ["a-1", "a-2", "a-3"],
+    "b": ["c", "b-1"],
+    "c": ["c-1"],
+}
+
+
+class FakeDrive:
+    """files().list(...).execute() по TREE; после fail_after запросов - ошибка, как при обрыве обхода."""
+
+    def __init__(self, fail_after=None, page_size=2):
+        self.fail_after = fail_after
+        self.page_size = page_size
+        self.fetched = []
+
+    def files(self):
+        return self
+
+    def list(self, q, pageSize, fields, pageToken=None, **kwargs):
+        folder_id = re.match(r"'([^']+)' in parents", q).group(1)
+        return FakeRequest(self, folder_id, pageToken)
+
+
+class FakeRequest:
+    def __init__(self, drive, folder_id, page_token):
+        self.drive = drive
+        self.folder_id = folder_id
+        self.page_token = page_token
+
+    def execute(self):
+        drive = self.drive
+        if drive.fail_after is not None and len(drive.fetched) >= drive.fail_after:
+            raise RuntimeError("connection reset")
+        drive.fetched.append((self.folder_id, self.page_token))
+        offset = int(self.page_token or 0)
+        children = TREE.get(self.folder_id, [])
+        page = children[offset:offset + drive.page_size]
+        result = {"files": [
+            {"id": item_id, "name": item_id, "parents": [self.folder_id],
+             "mimeType": FOLDER_MIME_TYPE if item_id in TREE else "text/plain"}
+            for item_id in page
+        ]}
+        if offset + drive.page_size < len(children):
+            result["nextPageToken"] = str(offset + drive.page_size)
+        return result
+
+
+@pytest.fixture(autouse=True)
+def checkpoint_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(crawler, "CRAWL_CHECKPOINT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_interrupted_crawl_resumes_without_repeating_pages(checkpoint_dir):
+    full = FakeDrive()
+    expected = FolderCrawl(full, "root", FIELDS).run()
+
+    interrupted = FakeDrive(fail_after=4)
+    with pytest.raises(RuntimeError):
+        FolderCrawl(interrupted, "root", FIELDS, checkpoint="files-test").run()
+    assert (checkpoint_dir / "files-test.json").exists()
+
+    resumed = FakeDrive()
+    items = FolderCrawl(resumed, "root", FIELDS, checkpoint="files-test").run()
+
+    assert [item["id"] for item in items] == [item["id"] for item in expected]
+    # Страницы, полученные до обрыва, повторно не запрашиваются
+    assert not set(interrupted.fetched) & set(resumed.fetched)
+    assert sorted(interrupted.fetched + resumed.fetched, key=str) == sorted(full.fetched, key=str)
+    assert not (checkpoint_dir / "files-test.json").exists()
+
+
+def test_checkpoint_of_another_root_is_ignored(checkpoint_dir):
+    with pytest.raises(RuntimeError):
+        FolderCrawl(FakeDrive(fail_after=2), "root", FIELDS, checkpoint="files-test").run()
+
+    drive = FakeDrive()
+    items = FolderCrawl(drive, "b", FIELDS, checkpoint="files-test").run()
+
+    assert [item["id"] for item in items] == ["c", "c-1", "b-1"]
+    assert drive.fetched[0] == ("b", None)
@@ -0,0 +1,35 @@
+import asyncio
+
+import httpx
+
+from app import main
+
+
+def test_concurrent_refresh_requests_start_one_job(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "cookies.pkl").write_bytes(b"")
+    monkeypatch.setattr(main, "background_jobs", {})
+    started = []
+
+    async def refresh_groups_in_background(cookies_path):
+        started.append(cookies_path)
+        await asyncio.sleep(0.1)
+
+    monkeypatch.setattr(main, "refresh_groups_in_background", refresh_groups_in_background)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*(client.post("/groups/refresh") for _ in range(5)))
+            await main.background_jobs["groups-refresh"]
+            after = await client.post("/groups/refresh")
+            await main.background_jobs["groups-refresh"]
+        return [response.json()["message"] for response in responses], after.json()["message"]
+
+    messages, after = asyncio.run(scenario())
+
+    assert messages.count("Groups refresh started") == 1
+    assert messages.count("Groups refresh already in progress") == 4
+    # Закончившаяся задача не мешает следующему обновлению
+    assert after == "Groups refresh started"
+    assert len(started) == 2
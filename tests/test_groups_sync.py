@@ -0,0 +1,115 @@
+import asyncio
+import functools
+import os
+import shutil
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.groups import sync
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "groups")
+
+requires_chrome = pytest.mark.skipif(
+    not any(shutil.which(name) for name in ("google-chrome", "chromium", "chromium-browser")),
+    reason="Chrome is not installed",
+)
+requires_database = pytest.mark.skipif(
+    os.getenv("TEST_DATABASE") != "1",
+    reason="set TEST_DATABASE=1 and DB_* of a throwaway Postgres database",
+)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fixture_site(monkeypatch):
+    """Список групп и страницы участников из tests/fixtures/groups; Last-Modified - время изменения файла."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=FIXTURES))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(sync, "GROUPS_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    yield
+    server.shutdown()
+
+
+def test_no_groups_starts_no_browser(monkeypatch):
+    def create_driver(*args, **kwargs):
+        raise AssertionError("browser started without groups")
+
+    monkeypatch.setattr(sync, "create_driver", create_driver)
+    assert sync.sync_members([], cookies_path=None) == []
+
+
+def test_groups_unchanged_in_list_open_no_member_pages(monkeypatch):
+    monkeypatch.setattr(sync, "start_session", lambda cookies_path: "driver")
+    monkeypatch.setattr(sync, "quit_driver", lambda driver: None)
+    monkeypatch.setattr(sync, "read_listed_counts", lambda driver: {"team-a": 3, "team-b": 2})
+    opened = []
+    monkeypatch.setattr(sync, "fetch_group_members", lambda driver, group: opened.append(group["id"]) or {
+        "group_id": group["id"], "members": [], "member_count": 2, "marker": None,
+    })
+    groups = [
+        {"id": 1, "href": "https://groups.google.com/u/0/g/team-a", "member_count": 3, "marker": None},
+        {"id": 2, "href": "https://groups.google.com/u/0/g/team-b/", "member_count": 1, "marker": None},
+        {"id": 3, "href": "https://groups.google.com/u/0/g/team-c", "member_count": 5, "marker": None},
+    ]
+
+    results = sync.sync_members(groups, cookies_path=None)
+
+    # team-a совпала со списком; team-b изменилась, team-c в списке нет - их страницы открываются
+    assert opened == [2, 3]
+    assert {"group_id": 1, "members": None} in results
+    assert len(results) == 3
+
+
+@requires_chrome
+def test_members_fetched_then_skipped_when_unchanged(fixture_site):
+    group = {"id": 1, "href": "https://groups.google.com/u/0/g/team-a", "member_count": None, "marker": None}
+
+    [first] = sync.sync_members([group], cookies_path=None)
+    assert first["member_count"] == 3
+    assert sorted(member["email"] for member in first["members"]) == [
+        "alice@example.com", "bob@example.com", "carol@example.com",
+    ]
+    assert {"email": "alice@example.com", "name": "Alice Smith"} in first["members"]
+
+    unchanged = {**group, "member_count": first["member_count"], "marker": first["marker"]}
+    [second] = sync.sync_members([unchanged], cookies_path=None)
+    assert second == {"group_id": 1, "members": None}
+
+
+@requires_chrome
+@requires_database
+def test_run_members_sync_writes_members(fixture_site, monkeypatch):
+    from sqlalchemy import select
+
+    from app.database import engine, session_scope
+    from app.groups.models import GroupMembers, Groups
+
+    tables = [Groups.__table__, GroupMembers.__table__]
+    monkeypatch.setattr(sync, "GROUPS_CSV", os.path.join(FIXTURES, "groups.csv"))
+
+    async def scenario():
+        async with engine.begin() as connection:
+            await connection.run_sync(lambda conn: Groups.metadata.create_all(conn, tables=tables))
+        try:
+            first = await sync.run_members_sync(cookies_path=None)
+            second = await sync.run_members_sync(cookies_path=None)
+            async with session_scope() as session:
+                members = (await session.execute(select(GroupMembers.email).order_by(GroupMembers.email))).scalars().all()
+            return first, second, members
+        finally:
+            async with engine.begin() as connection:
+                await connection.run_sync(lambda conn: Groups.metadata.drop_all(conn, tables=tables))
+            await engine.dispose()
+
+    first, second, members = asyncio.run(scenario())
+
+    assert first == {"groups": 2, "changed": 2, "skipped": 0, "failed": 0}
+    assert second == {"groups": 2, "changed": 0, "skipped": 2, "failed": 0}
+    assert members == ["alice@example.com", "bob@example.com", "carol@example.com", "dave@example.com"]
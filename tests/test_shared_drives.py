@@ -0,0 +1,63 @@
+import pytest
+
+from app import release
+from app.crawler import FolderCrawl
+
+
+@pytest.fixture
+def crawls(monkeypatch):
+    """Аргументы каждого FolderCrawl, созданного обходом /files."""
+    calls = []
+
+    def spy(service, root_id, fields, **kwargs):
+        calls.append({"root_id": root_id, **kwargs})
+        return FolderCrawl(service, root_id, fields, **kwargs)
+
+    monkeypatch.setattr(release, "FolderCrawl", spy)
+    release.find_folder_id.cache.clear()
+    release.find_shared_drives.cache.clear()
+    return calls
+
+
+def crawled(calls):
+    # Хэш параметров запроса в конце имени чекпоинта отбрасываем
+    return sorted((call["root_id"], call["checkpoint"].rsplit("-", 1)[0], call.get("drive_id")) for call in calls)
+
+
+def test_my_drive_only(drive_credentials, crawls, monkeypatch):
+    monkeypatch.setattr(release, "SHARED_DRIVES", "")
+
+    files = release.find_files(drive_credentials, older_than_minutes=0, exclude_owner="nobody@example.com")["files"]
+
+    assert crawled(crawls) == [("d", "files-default", None)]
+    assert files and all(file["driveId"] is None for file in files)
+
+
+def test_my_drive_and_shared_drive(drive_credentials, crawls):
+    files = release.find_files(drive_credentials, older_than_minutes=0, exclude_owner="nobody@example.com")["files"]
+
+    assert crawled(crawls) == [("d", "files-default", None), ("sd0", "files-default-sd0", "sd0")]
+    drives = {file["driveId"] for file in files}
+    assert drives == {None, "sd0"}
+    assert len(files) == len({file["id"] for file in files})
+
+
+def test_shared_drive_without_root_folder(drive_credentials, crawls, monkeypatch):
+    monkeypatch.setattr(release, "ROOT_FOLDER_NAME", "Missing folder")
+
+    files = release.find_files(drive_credentials, older_than_minutes=0, exclude_owner="nobody@example.com")["files"]
+
+    assert crawled(crawls) == [("sd0", "files-default-sd0", "sd0")]
+    assert files and all(file["driveId"] == "sd0" for file in files)
+
+
+def test_shared_drive_listing_failure_falls_back_to_my_drive(drive_credentials, crawls, monkeypatch):
+    def forbidden(service, account=release.LEGACY_ACCOUNT):
+        raise RuntimeError("insufficientPermissions")
+
+    monkeypatch.setattr(release, "find_shared_drives", forbidden)
+
+    files = release.find_files(drive_credentials, older_than_minutes=0, exclude_owner="nobody@example.com")["files"]
+
+    assert crawled(crawls) == [("d", "files-default", None)]
+    assert files